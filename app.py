@@ -13,10 +13,25 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
+import os
+import sys
+import io
+import json
+import hashlib
+import importlib.util
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import time
+import threading
+from collections import OrderedDict
 import warnings
 warnings.filterwarnings('ignore')
 
+# The loaded tables are shared by every session, so writes must never reach them in place.
+# pandas >= 3 always behaves this way; older versions need copy-on-write switched on.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # ================================================================================
 # PAGE CONFIGURATION
 # ================================================================================
@@ -209,163 +224,1058 @@ def format_currency_full(num):
     return f"AED {num:,.2f}"
 
 # ================================================================================
-# DATA LOADING AND CLEANING
+# DATA SOURCES & SNAPSHOT SETTINGS
 # ================================================================================
 
-@st.cache_data
-def load_and_clean_data():
-    """Load and thoroughly clean all data files"""
+SOURCE_FILES = {
+    'customers': 'customers.csv',
+    'orders': 'orders.csv',
+    'order_items': 'order_items.csv',
+    'fulfillment': 'fulfillment.csv',
+    'returns': 'returns.csv',
+}
+TABLE_NAMES = list(SOURCE_FILES.keys())
+
+# Upstream can also deliver a single workbook with one sheet per table.
+# Set SOUQPLUS_DATA_SOURCE=xlsx to read it instead of the CSVs.
+DATA_SOURCE = os.environ.get('SOUQPLUS_DATA_SOURCE', 'csv').lower()
+WORKBOOK_FILE = os.environ.get('SOUQPLUS_WORKBOOK', 'ecommerce_dataset.xlsx')
+WORKBOOK_SHEETS = {
+    'customers': 'CUSTOMERS',
+    'orders': 'ORDERS',
+    'order_items': 'ORDER_ITEMS',
+    'fulfillment': 'FULFILLMENT',
+    'returns': 'RETURNS',
+}
+
+# Cleaned tables are persisted here as Parquet so unchanged CSVs are never re-parsed.
+# Bump SNAPSHOT_VERSION whenever the cleaning rules below change.
+SNAPSHOT_DIR = '.snapshot'
+SNAPSHOT_VERSION = 8
+SNAPSHOT_MANIFEST = 'manifest.json'
+
+# ================================================================================
+# TABLE SCHEMAS
+# ================================================================================
+
+# Declared column types per table. Low-cardinality text becomes 'category',
+# dates are parsed with one fixed ISO format, and float32 is only used where the
+# value is never summed into a displayed total (so KPI cards keep full precision).
+DATE_FORMAT = '%Y-%m-%d'
+
+TABLE_SCHEMAS = {
+    'customers': {
+        'customer_id': 'str',
+        'customer_name': 'str',
+        'city': 'category',
+        'signup_date': 'date',
+        'signup_channel': 'category',
+        'customer_segment': 'category',
+    },
+    'orders': {
+        'order_id': 'str',
+        'customer_id': 'str',
+        'order_date': 'date',
+        'order_channel': 'category',
+        'order_status': 'category',
+        'gross_amount': 'float64',
+        'discount_amount': 'float64',
+        'net_amount': 'float64',
+        'payment_method': 'category',
+        'coupon_code': 'category',
+    },
+    'order_items': {
+        'item_id': 'str',
+        'order_id': 'str',
+        'product_category': 'category',
+        'product_name': 'category',
+        'quantity': 'int16',
+        'unit_price': 'float32',
+        'item_total': 'float64',
+    },
+    'fulfillment': {
+        'fulfillment_id': 'str',
+        'order_id': 'str',
+        'warehouse_hub': 'category',
+        'delivery_zone': 'category',
+        'promised_date': 'date',
+        'actual_delivery_date': 'date',
+        'delivery_status': 'category',
+        'delay_reason': 'category',
+        'delivery_partner': 'category',
+    },
+    'returns': {
+        'return_id': 'str',
+        'order_id': 'str',
+        'return_date': 'date',
+        'return_reason': 'category',
+        'refund_amount': 'float64',
+        'refund_status': 'category',
+    },
+}
+
+# Loyalty tiers: a customer lands in the last tier whose lower spend bound they reach
+TIER_LABELS = ['Bronze', 'Silver', 'Gold', 'Platinum']
+TIER_THRESHOLDS = [500, 2000, 5000]  # lower bound (AED) of every tier after the first
+TIER_DTYPE = pd.CategoricalDtype(TIER_LABELS, ordered=True)
+
+# Columns derived during cleaning rather than read from the sources
+DERIVED_SCHEMAS = {
+    'customers': {
+        'total_spending': 'float64',
+        'customer_tier': TIER_DTYPE,
+        'customer_key': 'int32',
+    },
+    'orders': {
+        'order_key': 'int32',
+        'customer_key': 'int32',
+    },
+    'order_items': {'order_key': 'int32'},
+    'fulfillment': {
+        'order_key': 'int32',
+        'is_delivered': 'bool',
+        'is_breach': 'bool',
+        'delay_days': 'int16',
+    },
+    'returns': {'order_key': 'int32'},
+}
+
+def csv_read_dtypes(table):
+    """dtype mapping for pd.read_csv - dates stay text and are parsed during cleaning,
+    integers are downcast after cleaning so missing values don't break the read"""
+    read_as = {'str': str, 'category': 'category', 'date': str,
+               'float64': 'float64', 'float32': 'float64', 'int16': 'float64'}
+    return {col: read_as[kind] for col, kind in TABLE_SCHEMAS[table].items()}
+
+def read_source_csv(table):
+    """Read one source CSV with its declared schema"""
+    return pd.read_csv(SOURCE_FILES[table], dtype=csv_read_dtypes(table))
+
+def read_workbook_sheets(tables):
+    """Stream the worksheets of `tables` from one openpyxl read-only handle into frames typed
+    like read_source_csv; returns {table: frame}.
+
+    The workbook (and its shared-strings table) is opened and parsed once for all sheets.
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(WORKBOOK_FILE, read_only=True, data_only=True)
     try:
-        customers = pd.read_csv('customers.csv')
-        orders = pd.read_csv('orders.csv')
-        order_items = pd.read_csv('order_items.csv')
-        fulfillment = pd.read_csv('fulfillment.csv')
-        returns = pd.read_csv('returns.csv')
-        
-        # ===== 1. REMOVE DUPLICATES =====
-        if 'customer_id' in customers.columns:
-            customers = customers.drop_duplicates(subset=['customer_id'], keep='first')
-        else:
-            customers = customers.drop_duplicates(keep='first')
-        
-        if 'order_id' in orders.columns:
-            orders = orders.drop_duplicates(subset=['order_id'], keep='first')
-        else:
-            orders = orders.drop_duplicates(keep='first')
-        
-        if 'order_item_id' in order_items.columns:
-            order_items = order_items.drop_duplicates(subset=['order_item_id'], keep='first')
-        elif 'item_id' in order_items.columns:
-            order_items = order_items.drop_duplicates(subset=['item_id'], keep='first')
-        else:
-            order_items = order_items.drop_duplicates(keep='first')
-        
-        if 'fulfillment_id' in fulfillment.columns:
-            fulfillment = fulfillment.drop_duplicates(subset=['fulfillment_id'], keep='first')
-        elif 'order_id' in fulfillment.columns:
-            fulfillment = fulfillment.drop_duplicates(subset=['order_id'], keep='first')
-        else:
-            fulfillment = fulfillment.drop_duplicates(keep='first')
-        
-        if 'return_id' in returns.columns:
-            returns = returns.drop_duplicates(subset=['return_id'], keep='first')
-        else:
-            returns = returns.drop_duplicates(keep='first')
-        
-        # ===== 2. STANDARDIZE CITY NAMES =====
-        city_mapping = {
-            'DUBAI': 'Dubai', 'dubai': 'Dubai', 'Dxb': 'Dubai', 'DXB': 'Dubai',
-            'ABU DHABI': 'Abu Dhabi', 'abu dhabi': 'Abu Dhabi', 'AD': 'Abu Dhabi', 'AbuDhabi': 'Abu Dhabi',
-            'SHARJAH': 'Sharjah', 'sharjah': 'Sharjah', 'SHJ': 'Sharjah',
-            'AJMAN': 'Ajman', 'ajman': 'Ajman', 'AJM': 'Ajman',
-            'RAS AL KHAIMAH': 'Ras Al Khaimah', 'ras al khaimah': 'Ras Al Khaimah', 
-            'RAK': 'Ras Al Khaimah', 'Ras al Khaimah': 'Ras Al Khaimah'
-        }
-        if 'city' in customers.columns:
-            customers['city'] = customers['city'].replace(city_mapping)
-        
-        # ===== 3. STANDARDIZE CATEGORY NAMES =====
-        category_mapping = {
-            'electronics': 'Electronics', 'ELECTRONICS': 'Electronics', 'Electronic': 'Electronics',
-            'fashion': 'Fashion', 'FASHION': 'Fashion', 'Fashions': 'Fashion',
-            'home & kitchen': 'Home & Kitchen', 'HOME & KITCHEN': 'Home & Kitchen', 
-            'Home and Kitchen': 'Home & Kitchen', 'home&kitchen': 'Home & Kitchen',
-            'beauty': 'Beauty', 'BEAUTY': 'Beauty', 'Beauties': 'Beauty',
-            'groceries': 'Groceries', 'GROCERIES': 'Groceries', 'Grocery': 'Groceries'
-        }
-        if 'product_category' in order_items.columns:
-            order_items['product_category'] = order_items['product_category'].replace(category_mapping)
-        
-        # ===== 4. HANDLE MISSING VALUES =====
-        if 'discount_amount' in orders.columns:
-            orders['discount_amount'] = orders['discount_amount'].fillna(0)
-        else:
-            orders['discount_amount'] = 0
-        
-        if 'delivery_zone' in fulfillment.columns:
-            fulfillment['delivery_zone'] = fulfillment['delivery_zone'].fillna('Unknown Zone')
-        
-        if 'delay_reason' in fulfillment.columns:
-            fulfillment['delay_reason'] = fulfillment['delay_reason'].fillna('No Delay')
-        
-        if 'delivery_partner' in fulfillment.columns:
-            fulfillment['delivery_partner'] = fulfillment['delivery_partner'].fillna('Unknown Partner')
+        sheets_by_name = {name.strip().lower(): name for name in workbook.sheetnames}
+        sheets = {}
+        for table in tables:
+            sheet_name = sheets_by_name.get(WORKBOOK_SHEETS[table].lower())
+            if sheet_name is None:
+                raise FileNotFoundError(f"Sheet '{WORKBOOK_SHEETS[table]}' not found in {WORKBOOK_FILE}")
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = [str(col).strip() for col in next(rows, ())]
+            sheets[table] = coerce_sheet_types(table, pd.DataFrame.from_records(
+                (row[:len(header)] for row in rows if any(value is not None for value in row)),
+                columns=header
+            ))
+    finally:
+        workbook.close()
+    return sheets
+
+def coerce_sheet_types(table, sheet):
+    """Excel hands back typed cells (datetimes, ints, floats) - coerce to the CSV reader's types"""
+    for col, kind in TABLE_SCHEMAS[table].items():
+        if col not in sheet.columns:
+            continue
+        if kind in ('str', 'category'):
+            sheet[col] = sheet[col].where(sheet[col].isna(), sheet[col].astype(str))
+            if kind == 'category':
+                sheet[col] = sheet[col].astype('category')
+        elif kind == 'date':
+            sheet[col] = pd.to_datetime(sheet[col], format=DATE_FORMAT, errors='coerce')
         else:
-            fulfillment['delivery_partner'] = 'Unknown Partner'
-        
-        if 'return_reason' in returns.columns:
-            returns['return_reason'] = returns['return_reason'].fillna('Not Specified')
-        
-        # ===== 5. CONVERT DATES =====
-        if 'signup_date' in customers.columns:
-            customers['signup_date'] = pd.to_datetime(customers['signup_date'], errors='coerce')
-        
-        if 'order_date' in orders.columns:
-            orders['order_date'] = pd.to_datetime(orders['order_date'], errors='coerce')
-        
-        if 'promised_date' in fulfillment.columns:
-            fulfillment['promised_date'] = pd.to_datetime(fulfillment['promised_date'], errors='coerce')
-        
-        if 'actual_delivery_date' in fulfillment.columns:
-            fulfillment['actual_delivery_date'] = pd.to_datetime(fulfillment['actual_delivery_date'], errors='coerce')
-        
-        if 'return_date' in returns.columns:
-            returns['return_date'] = pd.to_datetime(returns['return_date'], errors='coerce')
-        
+            sheet[col] = pd.to_numeric(sheet[col], errors='coerce').astype('float64')
+    return sheet
+
+def read_source_table(table):
+    """Read one raw table from the configured data source"""
+    if DATA_SOURCE == 'xlsx':
+        return read_workbook_sheets([table])[table]
+    return read_source_csv(table)
+
+def source_path(table):
+    """File a table is read from under the configured data source"""
+    return WORKBOOK_FILE if DATA_SOURCE == 'xlsx' else SOURCE_FILES[table]
+
+def parse_dates(series):
+    """Parse ISO dates with a fixed format - anything else becomes NaT"""
+    return pd.to_datetime(series, format=DATE_FORMAT, errors='coerce')
+
+def replace_values(series, mapping):
+    """Series.replace that works on categoricals by remapping only the categories"""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.replace(mapping)
+    new_labels = series.cat.categories.map(lambda c: mapping.get(c, c))
+    # Keep categories sorted so groupby output order matches the object-dtype behaviour
+    new_categories = new_labels.unique().sort_values()
+    code_map = new_categories.get_indexer(new_labels)
+    old_codes = series.cat.codes.to_numpy()
+    new_codes = np.where(old_codes >= 0, code_map[old_codes], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(new_codes, categories=new_categories),
+        index=series.index, name=series.name
+    )
+
+def fill_missing(series, value):
+    """Series.fillna that adds the fill value as a category first when needed"""
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.set_categories(series.cat.categories.union([value]))
+    return series.fillna(value)
+
+def observed_counts(series):
+    """value_counts without the zero rows categoricals report for unused categories"""
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+def apply_schema(table, df):
+    """Cast a cleaned table to its declared dtypes (idempotent)"""
+    df = df.copy()
+    schema = dict(TABLE_SCHEMAS[table], **DERIVED_SCHEMAS.get(table, {}))
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        if isinstance(kind, pd.CategoricalDtype):
+            df[col] = df[col].astype(kind)
+        elif kind == 'category':
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+        elif kind == 'date':
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = parse_dates(df[col])
+        elif kind in ('int16', 'bool'):
+            if df[col].notna().all():
+                df[col] = df[col].astype(kind)
+        elif kind in ('float32', 'float64'):
+            df[col] = df[col].astype(kind)
+    return df
+
+def schema_memory_report(tables):
+    """Memory of each cleaned table vs. the same table with object-dtype text columns"""
+    rows = []
+    for table, df in zip(TABLE_NAMES, tables):
+        typed_bytes = df.memory_usage(deep=True).sum()
+        untyped = df.copy()
+        for col in untyped.columns:
+            dtype = untyped[col].dtype
+            if not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)):
+                # Categorical and pandas str columns alike are held as Python objects untyped
+                untyped[col] = untyped[col].astype(object)
+            elif dtype == 'float32':
+                untyped[col] = untyped[col].astype('float64')
+            elif dtype == 'int16':
+                untyped[col] = untyped[col].astype('int64')
+        rows.append({
+            'Table': table,
+            'Rows': len(df),
+            'Typed (MB)': typed_bytes / 1e6,
+            'Untyped (MB)': untyped.memory_usage(deep=True).sum() / 1e6,
+        })
+    report = pd.DataFrame(rows)
+    report['Saved (MB)'] = report['Untyped (MB)'] - report['Typed (MB)']
+    return report
+
+# ================================================================================
+# DATA LOADING AND CLEANING
+# ================================================================================
+
+# Key columns tried in order when de-duplicating each table (full rows if none exist)
+DEDUP_KEYS = {
+    'customers': ['customer_id'],
+    'orders': ['order_id'],
+    'order_items': ['order_item_id', 'item_id'],
+    'fulfillment': ['fulfillment_id', 'order_id'],
+    'returns': ['return_id'],
+}
+
+CITY_MAPPING = {
+    'DUBAI': 'Dubai', 'dubai': 'Dubai', 'Dxb': 'Dubai', 'DXB': 'Dubai',
+    'ABU DHABI': 'Abu Dhabi', 'abu dhabi': 'Abu Dhabi', 'AD': 'Abu Dhabi', 'AbuDhabi': 'Abu Dhabi',
+    'SHARJAH': 'Sharjah', 'sharjah': 'Sharjah', 'SHJ': 'Sharjah',
+    'AJMAN': 'Ajman', 'ajman': 'Ajman', 'AJM': 'Ajman',
+    'RAS AL KHAIMAH': 'Ras Al Khaimah', 'ras al khaimah': 'Ras Al Khaimah', 
+    'RAK': 'Ras Al Khaimah', 'Ras al Khaimah': 'Ras Al Khaimah'
+}
+
+CATEGORY_MAPPING = {
+    'electronics': 'Electronics', 'ELECTRONICS': 'Electronics', 'Electronic': 'Electronics',
+    'fashion': 'Fashion', 'FASHION': 'Fashion', 'Fashions': 'Fashion',
+    'home & kitchen': 'Home & Kitchen', 'HOME & KITCHEN': 'Home & Kitchen', 
+    'Home and Kitchen': 'Home & Kitchen', 'home&kitchen': 'Home & Kitchen',
+    'beauty': 'Beauty', 'BEAUTY': 'Beauty', 'Beauties': 'Beauty',
+    'groceries': 'Groceries', 'GROCERIES': 'Groceries', 'Grocery': 'Groceries'
+}
+
+# Tables whose rows belong to an order (and are filtered through it)
+ORDER_CHILD_TABLES = ['order_items', 'fulfillment', 'returns']
+
+MIN_VALID_ORDER_DATE = pd.Timestamp('2020-01-01')
+OUTLIER_QUANTILE = 0.99
+OUTLIER_THRESHOLD = 10000
+
+def dedup_key(table, df):
+    """First de-duplication key column present in the table, or None"""
+    for col in DEDUP_KEYS[table]:
+        if col in df.columns:
+            return col
+    return None
+
+def drop_duplicate_rows(table, df):
+    """Keep the first row per key (or per identical row when the table has no key)"""
+    key = dedup_key(table, df)
+    if key is not None:
+        return df.drop_duplicates(subset=[key], keep='first')
+    return df.drop_duplicates(keep='first')
+
+def clean_customers(customers):
+    """Cleaning steps for the customers table"""
+    # ===== 1. REMOVE DUPLICATES =====
+    customers = drop_duplicate_rows('customers', customers)
+    
+    # ===== 2. STANDARDIZE CITY NAMES =====
+    if 'city' in customers.columns:
+        customers['city'] = replace_values(customers['city'], CITY_MAPPING)
+    
+    # ===== 5. CONVERT DATES =====
+    if 'signup_date' in customers.columns:
+        customers['signup_date'] = parse_dates(customers['signup_date'])
+    
+    return customers
+
+def clean_orders(orders):
+    """Row-level cleaning steps for the orders table (outliers and tiers need the full table)"""
+    # ===== 1. REMOVE DUPLICATES =====
+    orders = drop_duplicate_rows('orders', orders)
+    
+    # ===== 4. HANDLE MISSING VALUES =====
+    if 'discount_amount' in orders.columns:
+        orders['discount_amount'] = orders['discount_amount'].fillna(0)
+    else:
+        orders['discount_amount'] = 0
+    
+    # ===== 5. CONVERT DATES =====
+    if 'order_date' in orders.columns:
+        orders['order_date'] = parse_dates(orders['order_date'])
+    
+    # ===== 6. FIX IMPOSSIBLE DATES =====
+    today = pd.Timestamp.today()
+    
+    if 'order_date' in orders.columns:
+        orders = orders[
+            (orders['order_date'] >= MIN_VALID_ORDER_DATE) & 
+            (orders['order_date'] <= today)
+        ]
+    
+    # ===== 7. FIX NEGATIVE AMOUNTS =====
+    if 'net_amount' in orders.columns:
+        orders['net_amount'] = orders['net_amount'].abs()
+    
+    if 'gross_amount' in orders.columns:
+        orders['gross_amount'] = orders['gross_amount'].abs()
+    
+    if 'discount_amount' in orders.columns:
+        orders['discount_amount'] = orders['discount_amount'].abs()
+    
+    return orders
+
+def clean_order_items(order_items):
+    """Cleaning steps for the order items table"""
+    # ===== 1. REMOVE DUPLICATES =====
+    order_items = drop_duplicate_rows('order_items', order_items)
+    
+    # ===== 3. STANDARDIZE CATEGORY NAMES =====
+    if 'product_category' in order_items.columns:
+        order_items['product_category'] = replace_values(order_items['product_category'], CATEGORY_MAPPING)
+    
+    return order_items
+
+def clean_fulfillment(fulfillment):
+    """Cleaning steps for the fulfillment table"""
+    # ===== 1. REMOVE DUPLICATES =====
+    fulfillment = drop_duplicate_rows('fulfillment', fulfillment)
+    
+    # ===== 4. HANDLE MISSING VALUES =====
+    if 'delivery_zone' in fulfillment.columns:
+        fulfillment['delivery_zone'] = fill_missing(fulfillment['delivery_zone'], 'Unknown Zone')
+    
+    if 'delay_reason' in fulfillment.columns:
+        fulfillment['delay_reason'] = fill_missing(fulfillment['delay_reason'], 'No Delay')
+    
+    if 'delivery_partner' in fulfillment.columns:
+        fulfillment['delivery_partner'] = fill_missing(fulfillment['delivery_partner'], 'Unknown Partner')
+    else:
+        fulfillment['delivery_partner'] = 'Unknown Partner'
+    
+    # ===== 5. CONVERT DATES =====
+    if 'promised_date' in fulfillment.columns:
+        fulfillment['promised_date'] = parse_dates(fulfillment['promised_date'])
+    
+    if 'actual_delivery_date' in fulfillment.columns:
+        fulfillment['actual_delivery_date'] = parse_dates(fulfillment['actual_delivery_date'])
+    
+    return fulfillment
+
+def clean_returns(returns):
+    """Cleaning steps for the returns table"""
+    # ===== 1. REMOVE DUPLICATES =====
+    returns = drop_duplicate_rows('returns', returns)
+    
+    # ===== 4. HANDLE MISSING VALUES =====
+    if 'return_reason' in returns.columns:
+        returns['return_reason'] = fill_missing(returns['return_reason'], 'Not Specified')
+    
+    # ===== 5. CONVERT DATES =====
+    if 'return_date' in returns.columns:
+        returns['return_date'] = parse_dates(returns['return_date'])
+    
+    return returns
+
+TABLE_CLEANERS = {
+    'customers': clean_customers,
+    'orders': clean_orders,
+    'order_items': clean_order_items,
+    'fulfillment': clean_fulfillment,
+    'returns': clean_returns,
+}
+
+def flag_order_outliers(orders, revenue_cap):
+    """Step 8 - cap net_amount at the given revenue cap and flag very large orders"""
+    orders['net_amount_capped'] = orders['net_amount'].clip(upper=revenue_cap)
+    orders['is_outlier'] = orders['net_amount'] > OUTLIER_THRESHOLD
+    return orders
+
+def assign_tiers(spending):
+    """Vectorized tiering - bin spend against TIER_THRESHOLDS into an ordered categorical"""
+    codes = np.searchsorted(
+        np.asarray(TIER_THRESHOLDS, dtype='float64'), np.asarray(spending, dtype='float64'), side='right'
+    )
+    return pd.Categorical.from_codes(codes, dtype=TIER_DTYPE)
+
+def assign_customer_tiers(customers, orders):
+    """Step 9 - total spending and loyalty tier per customer"""
+    if 'net_amount' in orders.columns and 'customer_id' in orders.columns:
+        customer_spending = orders.groupby('customer_id')['net_amount'].sum()
+        customers['total_spending'] = customers['customer_id'].map(customer_spending).fillna(0)
+    else:
+        customers['total_spending'] = 0
+    # Customers without orders have zero spend and so land in the lowest tier
+    customers['customer_tier'] = assign_tiers(customers['total_spending'])
+    return customers
+
+def window_customer_tiers(orders, n_customers):
+    """Tier customers on their spend inside an already date-filtered order slice.
+
+    Returns a tier Categorical indexed by customer_key; only the slice is aggregated.
+    """
+    known = orders[orders['customer_key'] >= 0]
+    spending = np.bincount(known['customer_key'], weights=np.nan_to_num(known['net_amount'].to_numpy()),
+                           minlength=n_customers)
+    return assign_tiers(spending)
+
+def finalize_tables(cleaned):
+    """Cross-table steps that run once every table has been cleaned"""
+    customers, orders = cleaned['customers'], cleaned['orders']
+    
+    # ===== 8. HANDLE OUTLIERS =====
+    if 'net_amount' in orders.columns:
+        orders = flag_order_outliers(orders, orders['net_amount'].quantile(OUTLIER_QUANTILE))
+    
+    # ===== 9. CREATE CUSTOMER TIERS =====
+    customers = assign_customer_tiers(customers, orders)
+    
+    # ===== 10. SORT BY ORDER DATE =====
+    cleaned = sort_by_order_date(dict(cleaned, customers=customers, orders=orders))
+    
+    # ===== 11. DERIVE DELIVERY METRICS =====
+    cleaned['fulfillment'] = derive_delivery_metrics(cleaned['fulfillment'])
+    
+    # ===== 12. ASSIGN SURROGATE KEYS =====
+    cleaned = assign_surrogate_keys(cleaned)
+    
+    # ===== 13. ENFORCE DECLARED SCHEMA =====
+    return tuple(apply_schema(table, cleaned[table]) for table in TABLE_NAMES)
+
+def sort_by_order_date(tables):
+    """Sort orders and their child tables by order date so any date range is one contiguous
+    block of rows (see slice_date_window).
+
+    Child tables get a copy of their order's order_date; rows whose order was dropped during
+    cleaning get NaT and sort to the end, outside every range. Rows with the same date are
+    ordered by their raw row position (the index), so re-sorting a table that already went
+    through a sort - as an incremental ingest does - gives the same order as a full rebuild.
+    """
+    tables = dict(tables)
+    orders = tables['orders']
+    if 'order_date' not in orders.columns:
+        return tables
+    tables['orders'] = orders.sort_index(kind='stable').sort_values('order_date', kind='stable')
+    
+    if 'order_id' in orders.columns:
+        order_dates = orders.set_index('order_id')['order_date']
+        for table in ORDER_CHILD_TABLES:
+            df = tables[table]
+            if 'order_id' in df.columns:
+                df = df.assign(order_date=df['order_id'].map(order_dates))
+                tables[table] = df.sort_index(kind='stable').sort_values('order_date', kind='stable', na_position='last')
+    return tables
+
+# Value each derived delivery metric takes when the dates it needs are missing
+DELIVERY_METRICS_MISSING = {'is_delivered': False, 'is_breach': False, 'delay_days': 0}
+
+def derive_delivery_metrics(fulfillment):
+    """Add is_delivered, is_breach and delay_days (days late, never negative) as compact
+    columns, so views never redo the date arithmetic."""
+    if 'actual_delivery_date' not in fulfillment.columns:
+        return fulfillment
+    actual = fulfillment['actual_delivery_date']
+    metrics = {'is_delivered': actual.notna()}
+    if 'promised_date' in fulfillment.columns:
+        promised = fulfillment['promised_date']
+        metrics['is_breach'] = actual > promised
+        metrics['delay_days'] = (actual - promised).dt.days.clip(lower=0)
+    return fulfillment.assign(**{
+        col: values.fillna(DELIVERY_METRICS_MISSING[col]).astype(DERIVED_SCHEMAS['fulfillment'][col])
+        for col, values in metrics.items()
+    })
+
+def assign_surrogate_keys(tables):
+    """Add dense int32 keys so views can filter and join on integers instead of ID strings.
+
+    customer_key / order_key are row positions in customers / (date-sorted) orders, so the
+    ID column of that table is the reverse lookup for display. Referencing rows get the key
+    of their customer/order, or -1 when it was dropped during cleaning.
+    """
+    tables = dict(tables)
+    customers, orders = tables['customers'], tables['orders']
+    if 'customer_id' in customers.columns:
+        customer_ids = pd.Index(customers['customer_id'])
+        tables['customers'] = customers.assign(customer_key=np.arange(len(customers), dtype='int32'))
+        if 'customer_id' in orders.columns:
+            orders = orders.assign(customer_key=customer_ids.get_indexer(orders['customer_id']).astype('int32'))
+    if 'order_id' in orders.columns:
+        orders = orders.assign(order_key=np.arange(len(orders), dtype='int32'))
+        order_ids = pd.Index(orders['order_id'])
+        for table in ORDER_CHILD_TABLES:
+            df = tables[table]
+            if 'order_id' in df.columns:
+                tables[table] = df.assign(order_key=order_ids.get_indexer(df['order_id']).astype('int32'))
+    tables['orders'] = orders
+    return tables
+
+def next_future_order_date(raw_orders):
+    """Earliest raw order date after today, i.e. the day step 6 starts admitting more rows"""
+    if 'order_date' not in raw_orders.columns:
+        return None
+    dates = parse_dates(raw_orders['order_date'])
+    future = dates[dates > pd.Timestamp.today()]
+    return future.min().date().isoformat() if len(future) > 0 else None
+
+# ================================================================================
+# POLARS LAZY LOADER
+# ================================================================================
+
+# Alternative read + clean for the CSV source: each table becomes one Polars LazyFrame
+# (scan, row-level cleaning steps, step 6 date filter) that Polars optimizes and runs
+# multi-threaded, pushing the date predicate and column selection into the CSV scan.
+# The pandas cleaners above stay the reference; cross_check_loader() compares the two.
+# Set SOUQPLUS_LOADER_ENGINE=polars to use it. The workbook source always uses pandas.
+LOADER_ENGINE = os.environ.get('SOUQPLUS_LOADER_ENGINE', 'pandas').lower()
+
+# pandas.read_csv's default missing-value markers, so both readers see the same nulls
+CSV_NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                   '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+POLARS_ROW_INDEX = '_row'
+# Resolution of the datetimes parse_dates returns (ns before pandas 3, us from 3 on)
+PANDAS_DATE_UNIT = parse_dates(pd.Series([MIN_VALID_ORDER_DATE.strftime(DATE_FORMAT)])).dt.unit
+
+def scan_source_csv(table):
+    """Lazy Polars scan of one source CSV, typed like csv_read_dtypes (dates still text)"""
+    import polars as pl
+    scan = pl.scan_csv(SOURCE_FILES[table], infer_schema=False, null_values=CSV_NULL_VALUES)
+    columns = scan.collect_schema().names()
+    return scan.with_columns([
+        pl.col(col).cast(pl.Float64) for col, kind in TABLE_SCHEMAS[table].items()
+        if col in columns and kind not in ('str', 'category', 'date')
+    ])
+
+def clean_source_lazy(table, scan):
+    """Row-level cleaning of one table as a LazyFrame - the Polars counterpart of TABLE_CLEANERS"""
+    import polars as pl
+    columns = scan.collect_schema().names()
+    
+    def parsed(col):
+        return pl.col(col).str.to_datetime(DATE_FORMAT, time_unit=PANDAS_DATE_UNIT, strict=False)
+    
+    def filled(col, value):
+        return pl.col(col).fill_null(value) if col in columns else pl.lit(value).alias(col)
+    
+    # ===== 1. REMOVE DUPLICATES =====
+    # The file row number travels along as the index pandas would keep
+    key = next((col for col in DEDUP_KEYS[table] if col in columns), None)
+    lf = scan.with_row_index(POLARS_ROW_INDEX).unique(
+        subset=[key] if key is not None else columns, keep='first', maintain_order=True
+    )
+    
+    # ===== 2. / 3. STANDARDIZE CITY AND CATEGORY NAMES =====
+    if table == 'customers' and 'city' in columns:
+        lf = lf.with_columns(pl.col('city').replace(CITY_MAPPING))
+    if table == 'order_items' and 'product_category' in columns:
+        lf = lf.with_columns(pl.col('product_category').replace(CATEGORY_MAPPING))
+    
+    # ===== 4. HANDLE MISSING VALUES =====
+    if table == 'orders':
+        lf = lf.with_columns(filled('discount_amount', 0.0))
+    elif table == 'fulfillment':
+        lf = lf.with_columns(
+            [filled(col, value) for col, value in [('delivery_zone', 'Unknown Zone'), ('delay_reason', 'No Delay')]
+             if col in columns] + [filled('delivery_partner', 'Unknown Partner')]
+        )
+    elif table == 'returns' and 'return_reason' in columns:
+        lf = lf.with_columns(filled('return_reason', 'Not Specified'))
+    
+    # ===== 5. CONVERT DATES =====
+    lf = lf.with_columns([
+        parsed(col) for col, kind in TABLE_SCHEMAS[table].items() if kind == 'date' and col in columns
+    ])
+    
+    if table == 'orders':
         # ===== 6. FIX IMPOSSIBLE DATES =====
-        today = pd.Timestamp.today()
-        min_valid_date = pd.Timestamp('2020-01-01')
-        
-        if 'order_date' in orders.columns:
-            orders = orders[
-                (orders['order_date'] >= min_valid_date) & 
-                (orders['order_date'] <= today)
-            ]
+        if 'order_date' in columns:
+            lf = lf.filter(pl.col('order_date').is_between(
+                MIN_VALID_ORDER_DATE.to_pydatetime(), pd.Timestamp.today().to_pydatetime()
+            ))
         
         # ===== 7. FIX NEGATIVE AMOUNTS =====
-        if 'net_amount' in orders.columns:
-            orders['net_amount'] = orders['net_amount'].abs()
-        
-        if 'gross_amount' in orders.columns:
-            orders['gross_amount'] = orders['gross_amount'].abs()
-        
-        if 'discount_amount' in orders.columns:
-            orders['discount_amount'] = orders['discount_amount'].abs()
-        
-        # ===== 8. HANDLE OUTLIERS =====
-        if 'net_amount' in orders.columns:
-            revenue_cap = orders['net_amount'].quantile(0.99)
-            orders['net_amount_capped'] = orders['net_amount'].clip(upper=revenue_cap)
-            orders['is_outlier'] = orders['net_amount'] > 10000
-        
-        # ===== 9. CREATE CUSTOMER TIERS =====
-        if 'net_amount' in orders.columns and 'customer_id' in orders.columns:
-            customer_spending = orders.groupby('customer_id')['net_amount'].sum().reset_index()
-            customer_spending.columns = ['customer_id', 'total_spending']
-            
-            def assign_tier(spending):
-                if spending < 500:
-                    return 'Bronze'
-                elif spending < 2000:
-                    return 'Silver'
-                elif spending < 5000:
-                    return 'Gold'
-                else:
-                    return 'Platinum'
-            
-            customer_spending['customer_tier'] = customer_spending['total_spending'].apply(assign_tier)
-            customers = customers.merge(
-                customer_spending[['customer_id', 'total_spending', 'customer_tier']], 
-                on='customer_id', 
-                how='left'
+        lf = lf.with_columns([
+            pl.col(col).abs() for col in ['net_amount', 'gross_amount', 'discount_amount']
+            if col in lf.collect_schema().names()
+        ])
+    return lf
+
+def load_source_polars(table):
+    """Polars counterpart of read_source_csv + TABLE_CLEANERS: the cleaned table as pandas,
+    the raw row count and (for orders) next_future_order_date, from one shared scan"""
+    import polars as pl
+    scan = scan_source_csv(table)
+    queries = [clean_source_lazy(table, scan), scan.select(pl.len())]
+    if table == 'orders' and 'order_date' in scan.collect_schema().names():
+        order_dates = pl.col('order_date').str.to_datetime(DATE_FORMAT, strict=False)
+        queries.append(scan.select(order_dates.filter(order_dates > pd.Timestamp.today().to_pydatetime()).min()))
+    cleaned, raw_rows, *future = pl.collect_all(queries)
+    
+    cleaned = cleaned.to_pandas().set_index(POLARS_ROW_INDEX)
+    cleaned.index = cleaned.index.astype('int64').rename(None)
+    for col, kind in TABLE_SCHEMAS[table].items():
+        if kind == 'category' and col in cleaned.columns:
+            cleaned[col] = cleaned[col].astype('category')
+    next_date = future[0].item() if future else None
+    return cleaned, raw_rows.item(), next_date.date().isoformat() if next_date is not None else None
+
+def compare_frames(reference, candidate):
+    """'' when two frames hold the same index, columns and values (dtypes aside),
+    otherwise the first difference found"""
+    try:
+        pd.testing.assert_frame_equal(
+            reference, candidate, check_dtype=False, check_categorical=False, check_index_type=False
+        )
+    except AssertionError as e:
+        return ' '.join(str(e).split())[:200]
+    return ''
+
+@st.cache_data(show_spinner="Cross-checking the Polars loader against pandas...")
+def cross_check_loader(signature):
+    """Clean every source CSV with both engines and report where the results differ"""
+    rows = []
+    for table in TABLE_NAMES:
+        reference = TABLE_CLEANERS[table](read_source_csv(table))
+        candidate, _, _ = load_source_polars(table)
+        rows.append({
+            'Table': table,
+            'pandas rows': len(reference),
+            'Polars rows': len(candidate),
+            'Difference': compare_frames(reference, candidate) or 'none',
+        })
+    return pd.DataFrame(rows)
+
+if LOADER_ENGINE == 'polars' and importlib.util.find_spec('polars') is None:
+    st.error("SOUQPLUS_LOADER_ENGINE=polars needs the polars package: pip install polars")
+    st.stop()
+
+# ================================================================================
+# PARALLEL LOADER
+# ================================================================================
+
+# Tables are independent until step 8, so each one is read and cleaned on its own
+# worker thread. Threads (not processes) because functions defined in a Streamlit
+# script can't be pickled into a process pool; the CSV parser releases the GIL.
+LOADER_WORKERS = int(os.environ.get('SOUQPLUS_LOADER_WORKERS', min(len(TABLE_NAMES), os.cpu_count() or 1)))
+
+def load_source_table(table, raw=None):
+    """Read (unless the raw frame is passed in) and clean one source table, timing each phase"""
+    size = os.path.getsize(source_path(table))  # bytes covered by this read, for the manifest
+    started = time.perf_counter()
+    if LOADER_ENGINE == 'polars' and DATA_SOURCE == 'csv':
+        # Scan and cleaning run as one Polars plan, so it is all timed as the read
+        cleaned, rows, valid_until = load_source_polars(table)
+        return {
+            'cleaned': cleaned,
+            'size': size,
+            'rows': rows,
+            'valid_until': valid_until,
+            'read_s': time.perf_counter() - started,
+            'clean_s': 0.0,
+        }
+    if raw is None:
+        raw = read_source_table(table)
+    parsed = time.perf_counter()
+    cleaned = TABLE_CLEANERS[table](raw)
+    finished = time.perf_counter()
+    return {
+        'cleaned': cleaned,
+        'size': size,
+        'rows': len(raw),
+        'valid_until': next_future_order_date(raw) if table == 'orders' else None,
+        'read_s': parsed - started,
+        'clean_s': finished - parsed,
+    }
+
+def load_tables_parallel(workers=None):
+    """Read and clean all source tables concurrently; returns {table: load_source_table result}"""
+    workers = max(1, workers or LOADER_WORKERS)
+    # Largest files first so the longest task starts immediately
+    order = sorted(TABLE_NAMES, key=lambda table: os.path.getsize(source_path(table)), reverse=True)
+    # All sheets share one workbook, so it is parsed once up front and only cleaning runs
+    # per table; the sheet reads are timed under the first (largest) table
+    raw_tables = {}
+    if DATA_SOURCE == 'xlsx':
+        started = time.perf_counter()
+        raw_tables = read_workbook_sheets(TABLE_NAMES)
+        read_s = time.perf_counter() - started
+    load = lambda table: load_source_table(table, raw_tables.pop(table, None))
+    if workers == 1:
+        loaded = {table: load(table) for table in order}
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = dict(zip(order, pool.map(load, order)))
+    if DATA_SOURCE == 'xlsx':
+        loaded[order[0]]['read_s'] += read_s
+    return loaded
+
+# ================================================================================
+# COLUMNAR SNAPSHOT CACHE
+# ================================================================================
+
+def file_content_hash(path, limit=None):
+    """SHA-256 of a file's contents (or of its first `limit` bytes), read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+def source_signature():
+    """Cheap (size, mtime) signature of every source file - changes whenever a file is rewritten"""
+    signature = []
+    for table in TABLE_NAMES:
+        try:
+            stat = os.stat(source_path(table))
+            signature.append((table, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            # Missing files are reported by load_and_clean_data itself
+            signature.append((table, None, None))
+    return tuple(signature)
+
+def describe_source(table, ingested_bytes, ingested_rows):
+    """Manifest entry for a source file of which the first `ingested_bytes` have been loaded"""
+    path = source_path(table)
+    stat = os.stat(path)
+    return {
+        'path': path,
+        'size': ingested_bytes,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_content_hash(path, limit=ingested_bytes),
+        'rows': ingested_rows,
+    }
+
+def read_snapshot_manifest():
+    """Return the snapshot manifest, or None if there is no usable snapshot"""
+    manifest_path = os.path.join(SNAPSHOT_DIR, SNAPSHOT_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != SNAPSHOT_VERSION or manifest.get('data_source') != DATA_SOURCE:
+        return None
+    # Step 6 drops future-dated orders, so the snapshot expires on the first such date
+    valid_until = manifest.get('valid_until')
+    if valid_until is not None and pd.Timestamp.today() >= pd.Timestamp(valid_until):
+        return None
+    return manifest
+
+def write_snapshot_manifest(manifest):
+    """Atomically replace the snapshot manifest"""
+    manifest_path = os.path.join(SNAPSHOT_DIR, SNAPSHOT_MANIFEST)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def source_change(table, recorded):
+    """Compare a source file with its manifest entry: 'same', 'touched', 'append' or 'changed'.
+
+    Size is checked first, then mtime, and the content hash only when those disagree.
+    'touched' means the mtime moved but the content is identical.
+    """
+    path = source_path(table)
+    stat = os.stat(path)
+    if stat.st_size == recorded['size']:
+        if stat.st_mtime_ns == recorded['mtime_ns']:
+            return 'same'
+        return 'touched' if file_content_hash(path) == recorded['sha256'] else 'changed'
+    if stat.st_size > recorded['size'] and file_content_hash(path, limit=recorded['size']) == recorded['sha256']:
+        # Only a pure append if the ingested part ended on a complete line
+        with open(path, 'rb') as f:
+            f.seek(recorded['size'] - 1)
+            if f.read(1) == b'\n':
+                return 'append'
+    return 'changed'
+
+def read_snapshot_tables():
+    """Read the cleaned tables back from Parquet"""
+    return tuple(
+        pd.read_parquet(os.path.join(SNAPSHOT_DIR, f"{table}.parquet"))
+        for table in TABLE_NAMES
+    )
+
+def save_snapshot(tables, manifest):
+    """Persist the cleaned tables as Parquet, then the manifest that validates them"""
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        # Drop the old manifest first so a half-written snapshot is never considered valid
+        manifest_path = os.path.join(SNAPSHOT_DIR, SNAPSHOT_MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        
+        for table, df in zip(TABLE_NAMES, tables):
+            table_path = os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+            df.to_parquet(table_path + '.tmp')
+            os.replace(table_path + '.tmp', table_path)
+        
+        write_snapshot_manifest(dict(manifest, version=SNAPSHOT_VERSION, data_source=DATA_SOURCE))
+    except (OSError, ImportError, ValueError):
+        # The snapshot is purely an accelerator - the dashboard still works without it
+        pass
+
+# ================================================================================
+# INCREMENTAL (APPEND-ONLY) INGESTION
+# ================================================================================
+
+# Exports of these tables only ever grow at the tail, so appended rows are parsed and
+# folded into the snapshot on their own. Any other kind of change rebuilds from scratch.
+INCREMENTAL_INGEST = True
+APPEND_ONLY_TABLES = ['orders', 'order_items', 'fulfillment', 'returns']
+
+def read_appended_rows(table, offset):
+    """Parse only the complete lines written after byte `offset`; returns (rows, new offset)"""
+    with open(SOURCE_FILES[table], 'rb') as f:
+        header = f.readline()
+        f.seek(offset)
+        appended = f.read()
+    # A writer may still be mid-line - leave any partial last line for the next load
+    complete = appended[:appended.rfind(b'\n') + 1]
+    if not complete.strip():
+        return None, offset
+    rows = pd.read_csv(io.BytesIO(header + complete), dtype=csv_read_dtypes(table))
+    return rows, offset + len(complete)
+
+def concat_cleaned(table, existing, new_rows):
+    """Append cleaned rows to a cleaned table, keeping categorical columns categorical"""
+    existing = existing.copy()
+    new_rows = apply_schema(table, new_rows)
+    for col in existing.columns:
+        if col not in new_rows.columns:
+            continue
+        if isinstance(existing[col].dtype, pd.CategoricalDtype) and isinstance(new_rows[col].dtype, pd.CategoricalDtype):
+            categories = existing[col].cat.categories.union(new_rows[col].cat.categories)
+            existing[col] = existing[col].cat.set_categories(categories)
+            new_rows[col] = new_rows[col].cat.set_categories(categories)
+    return pd.concat([existing, new_rows])
+
+def update_customer_tiers(customers, new_orders):
+    """Step 9, incrementally - add the new orders' spend and re-tier only the customers they touch"""
+    if 'net_amount' not in new_orders.columns or 'customer_id' not in new_orders.columns or len(new_orders) == 0:
+        return customers
+    new_spending = new_orders.groupby('customer_id')['net_amount'].sum()
+    affected = customers['customer_id'].isin(new_spending.index)
+    if not affected.any():
+        return customers
+    customers = customers.copy()
+    spending = customers.loc[affected, 'total_spending'] + customers.loc[affected, 'customer_id'].map(new_spending)
+    customers.loc[affected, 'total_spending'] = spending
+    customers.loc[affected, 'customer_tier'] = assign_tiers(spending)
+    return customers
+
+def ingest_appended_rows(tables, manifest, appended, row_offsets):
+    """Clean appended raw rows with the normal rules and fold them into the cleaned tables.
+
+    `row_offsets` holds how many raw rows of each table were ingested before this batch.
+
+    Derived fields are updated rather than recomputed: the 99th-percentile cap is re-derived
+    from the in-memory net_amount column and only re-applied to older rows if it moved, and
+    spend and tiers are only recomputed for customers that appear in the new orders.
+    """
+    tables = dict(zip(TABLE_NAMES, tables))
+    for table, raw_rows in appended.items():
+        new_rows = TABLE_CLEANERS[table](raw_rows)
+        # Give new rows the same index a full rebuild would (their raw row position)
+        new_rows.index = new_rows.index + row_offsets[table]
+        
+        existing = tables[table]
+        key = dedup_key(table, existing)
+        if key is not None and key in new_rows.columns:
+            new_rows = new_rows[~new_rows[key].isin(existing[key])]
+        
+        if table == 'orders' and 'net_amount' in new_rows.columns:
+            revenue_cap = np.nanquantile(
+                np.concatenate([existing['net_amount'].to_numpy(), new_rows['net_amount'].to_numpy()]),
+                OUTLIER_QUANTILE
             )
-            customers['customer_tier'] = customers['customer_tier'].fillna('Bronze')
-            customers['total_spending'] = customers['total_spending'].fillna(0)
-        else:
-            customers['customer_tier'] = 'Bronze'
-            customers['total_spending'] = 0
-        
-        return customers, orders, order_items, fulfillment, returns
+            if revenue_cap != manifest.get('revenue_cap'):
+                existing = flag_order_outliers(existing.copy(), revenue_cap)
+            new_rows = flag_order_outliers(new_rows, revenue_cap)
+            manifest['revenue_cap'] = float(revenue_cap)
+            tables['customers'] = update_customer_tiers(tables['customers'], new_rows)
+        
+        if table == 'fulfillment':
+            # Delivery metrics only read a shipment's own dates, so only new rows need them
+            new_rows = derive_delivery_metrics(new_rows)
+        
+        tables[table] = concat_cleaned(table, existing, new_rows)
+    tables = sort_by_order_date(tables)
+    tables = assign_surrogate_keys(tables)
+    return tuple(tables[table] for table in TABLE_NAMES)
+
+def try_incremental_load(manifest):
+    """Serve the data from the snapshot, ingesting appended rows if that is all that changed.
+
+    Returns None when a full rebuild is required.
+    """
+    changes = {table: source_change(table, manifest['sources'][table]) for table in TABLE_NAMES}
+    appended_tables = [table for table, change in changes.items() if change == 'append']
+    
+    if any(change == 'changed' for change in changes.values()):
+        return None
+    if appended_tables and not (
+        INCREMENTAL_INGEST and DATA_SOURCE == 'csv' and set(appended_tables) <= set(APPEND_ONLY_TABLES)
+    ):
+        return None
+    
+    tables = read_snapshot_tables()
+    for table, change in changes.items():
+        if change == 'touched':
+            manifest['sources'][table]['mtime_ns'] = os.stat(source_path(table)).st_mtime_ns
+    
+    if not appended_tables:
+        if 'touched' in changes.values():
+            write_snapshot_manifest(manifest)
+        return tables
+    
+    appended = {}
+    appended_counts = {}
+    row_offsets = {}
+    for table in appended_tables:
+        recorded = manifest['sources'][table]
+        rows, offset = read_appended_rows(table, recorded['size'])
+        if rows is None:
+            continue
+        appended[table] = rows
+        appended_counts[table] = len(rows)
+        row_offsets[table] = recorded['rows']
+        manifest['sources'][table] = describe_source(table, offset, recorded['rows'] + len(rows))
+    
+    if not appended:
+        return tables
+    
+    tables = ingest_appended_rows(tables, manifest, appended, row_offsets)
+    if 'orders' in appended:
+        future_date = next_future_order_date(appended['orders'])
+        if future_date is not None:
+            manifest['valid_until'] = min(filter(None, [manifest.get('valid_until'), future_date]))
+    manifest['last_ingest'] = {'mode': 'incremental', 'rows': appended_counts}
+    save_snapshot(tables, manifest)
+    return tables
+
+@st.cache_data(show_spinner="Rebuilding from source to check the snapshot...")
+def cross_check_snapshot(signature, _tables):
+    """Rebuild every table from the source files and report where the served tables
+    (grown by incremental ingests) differ from the rebuild"""
+    loaded = load_tables_parallel()
+    rebuilt = finalize_tables({table: result['cleaned'] for table, result in loaded.items()})
+    return pd.DataFrame([
+        {
+            'Table': table,
+            'Served rows': len(served),
+            'Rebuilt rows': len(reference),
+            'Difference': compare_frames(reference, served) or 'none',
+        }
+        for table, served, reference in zip(TABLE_NAMES, _tables, rebuilt)
+    ])
+
+@st.cache_resource(max_entries=1, show_spinner="Loading dataset...")
+def load_and_clean_data(signature=None):
+    """Load and thoroughly clean all data files, using the Parquet snapshot when it is current.
+
+    The result is a process-wide resource: every session and rerun reads the same frames
+    instead of unpickling its own copy. Use shared_table_views() rather than touching
+    them directly. `signature` is only used as the cache key so that rewritten source
+    files are picked up (and the previous version released).
+    """
+    try:
+        manifest = read_snapshot_manifest()
+        if manifest is not None:
+            try:
+                tables = try_incremental_load(manifest)
+                if tables is not None:
+                    return tables
+            except (OSError, ImportError, ValueError, KeyError):
+                pass  # Fall through to a full rebuild
+        
+        started = time.perf_counter()
+        loaded = load_tables_parallel()
+        tables = finalize_tables({table: result['cleaned'] for table, result in loaded.items()})
+        wall_s = time.perf_counter() - started
+        
+        cleaned_orders = tables[TABLE_NAMES.index('orders')]
+        save_snapshot(tables, {
+            'valid_until': loaded['orders']['valid_until'],
+            'revenue_cap': float(cleaned_orders['net_amount'].quantile(OUTLIER_QUANTILE)) if 'net_amount' in cleaned_orders.columns else None,
+            'last_ingest': {
+                'mode': 'full',
+                'rows': {table: loaded[table]['rows'] for table in TABLE_NAMES},
+                'workers': LOADER_WORKERS,
+                'wall_s': wall_s,
+                'timings': {
+                    table: {'read_s': loaded[table]['read_s'], 'clean_s': loaded[table]['clean_s']}
+                    for table in TABLE_NAMES
+                },
+            },
+            'sources': {
+                table: describe_source(table, loaded[table]['size'], loaded[table]['rows'])
+                for table in TABLE_NAMES
+            },
+        })
+        return tables
         
     except FileNotFoundError as e:
         st.error(f"Data file not found: {e}")
@@ -376,7 +1286,593 @@ def load_and_clean_data():
         st.stop()
 
 # Load data
-customers_df, orders_df, order_items_df, fulfillment_df, returns_df = load_and_clean_data()
+def shared_table_views(tables):
+    """Shallow, copy-on-write views of the shared tables for one rerun.
+
+    The views share column buffers with the process-wide dataset (no copying), but any
+    in-place write or added column lands on the view only, so one session can never
+    mutate data another session is reading.
+    """
+    return tuple(df.copy(deep=False) for df in tables)
+
+data_signature = source_signature()
+customers_df, orders_df, order_items_df, fulfillment_df, returns_df = shared_table_views(
+    load_and_clean_data(data_signature)
+)
+
+@st.cache_data
+def dataset_memory_report(signature, _tables):
+    """Per-table memory savings from the declared schema, computed once per dataset version"""
+    return schema_memory_report(_tables)
+
+# ================================================================================
+# ORDER FACT TABLE
+# ================================================================================
+
+# One wide row per order (same rows and order as orders_df): the order plus its customer,
+# fulfillment and return attributes, so views filter a single table instead of
+# re-joining the source tables on every rerun. Item-level figures live in the item cube.
+FACT_CUSTOMER_COLUMNS = ['city', 'customer_segment', 'customer_tier']
+FACT_FULFILLMENT_COLUMNS = [
+    'warehouse_hub', 'delivery_zone', 'delivery_partner', 'delivery_status',
+    'promised_date', 'actual_delivery_date', 'delay_reason',
+]
+
+def first_row_per_order(df, n_orders):
+    """Row position in `df` of each order's first row (-1 if it has none), by order_key"""
+    positions = np.full(n_orders, -1, dtype='int64')
+    keys = df['order_key'].to_numpy()
+    known = np.flatnonzero(keys >= 0)
+    order_keys, first = np.unique(keys[known], return_index=True)
+    positions[order_keys] = known[first]
+    return positions
+
+def sum_per_order(df, n_orders, column=None):
+    """Sum `column` (or count rows) per order_key into a dense array; missing keys are skipped"""
+    known = df[df['order_key'] >= 0]
+    weights = None if column is None else np.nan_to_num(known[column].to_numpy(dtype='float64'))
+    return np.bincount(known['order_key'], weights=weights, minlength=n_orders)
+
+def previous_customer_orders(customer_ids, order_dates):
+    """Date of each order's previous and second-previous order by the same customer
+    (NaT when there is none), for orders sorted by date.
+
+    Orders without a customer get their own date for both, so window_customer_counts
+    never counts them.
+    """
+    codes = pd.factorize(customer_ids)[0]
+    dates = order_dates.to_numpy()
+    # Stable sort by customer keeps each customer's orders in date order
+    by_customer = np.argsort(codes, kind='stable')
+    same_customer = codes[by_customer][1:] == codes[by_customer][:-1]
+    prev = np.full(len(codes), -1)
+    prev[by_customer[1:][same_customer]] = by_customer[:-1][same_customer]
+    prev2 = np.where(prev >= 0, prev[np.maximum(prev, 0)], -1)
+    
+    def dates_at(positions):
+        return np.where(codes < 0, dates, np.where(positions >= 0, dates[np.maximum(positions, 0)], np.datetime64('NaT')))
+    return dates_at(prev), dates_at(prev2)
+
+def build_order_facts(customers, orders, order_items, fulfillment, returns):
+    """Denormalize the five tables into one row per order.
+
+    Fulfillment is one row per order in the source; should an order have several, the
+    first is used. Returns are aggregated per order.
+    """
+    facts = orders.copy(deep=False)
+    n_orders = len(orders)
+
+    if 'customer_id' in facts.columns and 'order_date' in facts.columns:
+        facts['prev_order_date'], facts['prev_order_date_2'] = previous_customer_orders(
+            facts['customer_id'], facts['order_date']
+        )
+
+    if 'customer_key' in facts.columns:
+        customer_keys = facts['customer_key'].to_numpy()
+        for col in FACT_CUSTOMER_COLUMNS:
+            if col in customers.columns:
+                facts[col] = customers[col].array.take(customer_keys, allow_fill=True)
+
+    if 'order_key' in fulfillment.columns:
+        positions = first_row_per_order(fulfillment, n_orders)
+        for col in FACT_FULFILLMENT_COLUMNS:
+            if col in fulfillment.columns:
+                facts[col] = fulfillment[col].array.take(positions, allow_fill=True)
+        # Orders without a shipment get the metrics' missing-date values
+        for col, missing in DELIVERY_METRICS_MISSING.items():
+            if col in fulfillment.columns:
+                values = fulfillment[col].to_numpy()
+                facts[col] = np.where(positions >= 0, values[np.maximum(positions, 0)], missing).astype(values.dtype)
+
+    if 'order_key' in returns.columns:
+        facts['return_count'] = sum_per_order(returns, n_orders).astype('int32')
+        if 'refund_amount' in returns.columns:
+            refunded = returns
+            if 'refund_status' in returns.columns:
+                refunded = returns[returns['refund_status'] == 'Processed']
+            facts['refund_amount'] = sum_per_order(refunded, n_orders, 'refund_amount')
+    return facts
+
+@st.cache_resource(max_entries=1, show_spinner="Building order facts...")
+def load_order_facts(signature, _tables):
+    """build_order_facts once per dataset version, shared across sessions like the tables"""
+    return build_order_facts(*_tables)
+
+order_facts_df = load_order_facts(
+    data_signature, (customers_df, orders_df, order_items_df, fulfillment_df, returns_df)
+).copy(deep=False)
+
+# ================================================================================
+# DAILY SALES CUBE
+# ================================================================================
+
+# Order totals pre-aggregated per day x city x segment x tier x channel x status. The
+# Executive charts slice and sum this instead of the order rows, so their cost grows
+# with the number of distinct cells rather than with the number of orders.
+SALES_CUBE_DIMENSIONS = ['order_date', 'city', 'customer_segment', 'customer_tier', 'order_channel', 'order_status']
+SALES_CUBE_MEASURES = ['net_amount', 'gross_amount', 'discount_amount']
+
+def build_sales_cube(facts):
+    """Sum the sales measures and count orders per cube cell, sorted by order date.
+
+    Missing dimension values form their own cells so every order is counted once.
+    """
+    dimensions = [col for col in SALES_CUBE_DIMENSIONS if col in facts.columns]
+    measures = {col: (col, 'sum') for col in SALES_CUBE_MEASURES if col in facts.columns}
+    cube = facts.groupby(dimensions, observed=True, dropna=False, sort=True).agg(
+        orders=('order_date', 'size'), **measures
+    )
+    return cube.reset_index()
+
+@st.cache_resource(max_entries=1, show_spinner="Building sales cube...")
+def load_sales_cube(signature, _facts):
+    """build_sales_cube once per dataset version"""
+    return build_sales_cube(_facts)
+
+sales_cube_df = load_sales_cube(data_signature, order_facts_df).copy(deep=False)
+
+# ================================================================================
+# FULFILLMENT CUBE
+# ================================================================================
+
+# Delivery outcomes pre-aggregated per order day x delivery day x zone x partner x hub x
+# delay reason, so the Manager view never re-derives SLA breaches from fulfillment rows.
+# The order day drives the sidebar window; the delivery day is the breach trend's x-axis.
+FULFILLMENT_CUBE_DIMENSIONS = [
+    'order_date', 'actual_delivery_date', 'delivery_zone', 'delivery_partner', 'warehouse_hub', 'delay_reason',
+]
+
+# first_breach_row of a cell without breaches
+NO_ROW = np.iinfo(np.int64).max
+
+# Cube column holding each cell's first source row that counts towards a measure
+FIRST_SEEN_COLUMNS = {'deliveries': 'first_row', 'breaches': 'first_breach_row'}
+
+def build_fulfillment_cube(orders, fulfillment):
+    """Count deliveries, delivered / on-time / breached / cancelled shipments and sum delay
+    days per cube cell, sorted by order date.
+
+    on_time + breaches is the number of shipments with both dates, i.e. the count behind
+    the delay_days sum. first_row / first_breach_row hold the raw row position of the
+    cell's first shipment / first breached shipment, for top_counts' tie order. Fulfillment
+    rows whose order was dropped are left out.
+    """
+    shipments = fulfillment[fulfillment['order_key'] >= 0]
+    shipments = shipments.assign(first_row=shipments.index.to_numpy())
+    measures = {'deliveries': ('order_key', 'size'), 'first_row': ('first_row', 'min')}
+    if 'is_breach' in shipments.columns:
+        # Both dates known and not late
+        on_time = shipments['is_delivered'] & shipments['promised_date'].notna() & ~shipments['is_breach']
+        shipments = shipments.assign(
+            on_time=on_time,
+            first_breach_row=shipments['first_row'].where(shipments['is_breach'], NO_ROW),
+        )
+        measures['first_breach_row'] = ('first_breach_row', 'min')
+        measures.update({
+            'delivered': ('is_delivered', 'sum'),
+            'on_time': ('on_time', 'sum'),
+            'breaches': ('is_breach', 'sum'),
+            'delay_days': ('delay_days', 'sum'),
+        })
+    if 'order_status' in orders.columns:
+        order_status = orders['order_status'].array.take(shipments['order_key'].to_numpy())
+        shipments = shipments.assign(cancelled=order_status == 'Cancelled')
+        measures['cancelled'] = ('cancelled', 'sum')
+    
+    dimensions = [col for col in FULFILLMENT_CUBE_DIMENSIONS if col in shipments.columns]
+    cube = shipments.groupby(dimensions, observed=True, dropna=False, sort=True).agg(**measures)
+    return cube.reset_index()
+
+def top_counts(cube, dimension, measure, where=None):
+    """Cube counterpart of observed_counts(rows[dimension]): `measure` summed per value,
+    largest first, values that sum to zero dropped"""
+    counts = aggregate(cube, dimension, [measure], where).set_index(dimension)[measure]
+    first_seen = FIRST_SEEN_COLUMNS.get(measure)
+    if first_seen in cube.columns:
+        # Put values in order of first appearance in the source rows first, so ties rank
+        # as value_counts over the rows ranked them
+        cells = cube
+        for col, value in (where or {}).items():
+            cells = cells[cells[col] == value]
+        first_rows = cells.groupby(dimension, observed=True)[first_seen].min()
+        counts = counts.loc[first_rows.reindex(counts.index).sort_values(kind='stable').index]
+    counts = counts.sort_values(ascending=False, kind='stable')
+    return counts[counts > 0]
+
+def top_values_per_group(cube, group, value, measure, n=1, where=None):
+    """The `n` most common `value`s per `group`, weighting cells by `measure`, as
+    (group, value, measure) rows, largest first.
+
+    One grouped count, one stable sort and a positional head per group - no per-group
+    Python. Ties go to the first value in category order, as Series.mode would pick.
+    """
+    counts = aggregate(cube, [group, value], [measure], where)
+    counts = counts[counts[measure] > 0].sort_values(measure, ascending=False, kind='stable')
+    return counts.groupby(group, observed=True, sort=False).head(n)
+
+@st.cache_resource(max_entries=1, show_spinner="Building fulfillment cube...")
+def load_fulfillment_cube(signature, _tables):
+    """build_fulfillment_cube once per dataset version"""
+    return build_fulfillment_cube(*_tables)
+
+fulfillment_cube_df = load_fulfillment_cube(data_signature, (orders_df, fulfillment_df)).copy(deep=False)
+
+# ================================================================================
+# ITEM CATEGORY CUBE
+# ================================================================================
+
+# Item sales and returns pre-aggregated per order day x product category x city x
+# channel, for the category revenue and return-rate charts.
+ITEM_CUBE_DIMENSIONS = ['order_date', 'product_category', 'city', 'order_channel']
+
+def build_item_cube(facts, order_items):
+    """Sum item_total and quantity, count distinct orders and attributed returns per cube
+    cell, sorted by order date.
+
+    A category's orders are the orders with at least one item in it; an order's returns
+    are attributed to the category of its first item. Items whose order was dropped
+    are left out.
+    """
+    items = order_items[order_items['order_key'] >= 0]
+    order_keys = items['order_key'].to_numpy()
+    items = items.assign(**{
+        col: facts[col].array.take(order_keys) for col in ['city', 'order_channel'] if col in facts.columns
+    })
+    measures = {col: (col, 'sum') for col in ['item_total', 'quantity'] if col in items.columns}
+    
+    if 'product_category' in items.columns:
+        first_in_category = ~items.duplicated(['order_key', 'product_category'])
+        items = items.assign(orders=first_in_category.to_numpy(dtype='int32'))
+        measures['orders'] = ('orders', 'sum')
+    if 'return_count' in facts.columns:
+        returns = np.zeros(len(items), dtype='int32')
+        first_items = first_row_per_order(items, len(facts))
+        has_items = first_items >= 0
+        returns[first_items[has_items]] = facts['return_count'].to_numpy()[has_items]
+        items = items.assign(returns=returns)
+        measures['returns'] = ('returns', 'sum')
+    
+    dimensions = [col for col in ITEM_CUBE_DIMENSIONS if col in items.columns]
+    cube = items.groupby(dimensions, observed=True, dropna=False, sort=True).agg(**measures)
+    return cube.reset_index()
+
+@st.cache_resource(max_entries=1, show_spinner="Building item cube...")
+def load_item_cube(signature, _tables):
+    """build_item_cube once per dataset version"""
+    return build_item_cube(*_tables)
+
+item_cube_df = load_item_cube(data_signature, (order_facts_df, order_items_df)).copy(deep=False)
+
+# ================================================================================
+# DAILY KPI PREFIX SUMS
+# ================================================================================
+
+# Every headline KPI except the repeat rate and the breach breakdowns is a ratio of sums
+# over the date window. Keeping one running total per day of each numerator and
+# denominator turns any From/To window into two row lookups (see window_totals).
+def daily_sums(dates, values, first_day, n_days):
+    """Per-day sums of `values` for rows dated first_day .. first_day + n_days - 1"""
+    day = ((dates - first_day) // pd.Timedelta(days=1)).to_numpy(dtype='float64')
+    in_range = (day >= 0) & (day < n_days)  # also drops NaT days
+    weights = np.nan_to_num(np.asarray(values, dtype='float64'))
+    return np.bincount(day[in_range].astype('int64'), weights=weights[in_range], minlength=n_days)
+
+def build_kpi_prefix_sums(facts, fulfillment_cube):
+    """Running totals per calendar day of the KPI numerators and denominators.
+
+    Row i holds the totals over every order dated up to and including day i; a leading
+    row of zeros (dated the day before the first order) makes window sums a plain
+    difference of two rows.
+    """
+    if 'order_date' not in facts.columns or len(facts) == 0:
+        return pd.DataFrame()
+    dates = facts['order_date']
+    first_day = dates.min()
+    n_days = (dates.max() - first_day).days + 1
+    measures = {'orders': np.ones(len(facts))}
+    
+    # Without a status every order counts as delivered, as in calculate_executive_kpis
+    delivered = np.ones(len(facts), dtype=bool)
+    if 'order_status' in facts.columns:
+        delivered = (facts['order_status'] == 'Delivered').to_numpy()
+        measures['cancelled_orders'] = (facts['order_status'] == 'Cancelled').to_numpy()
+    measures['delivered_orders'] = delivered
+    if 'net_amount' in facts.columns:
+        net = facts['net_amount'].to_numpy(dtype='float64')
+        measures['net_amount'] = net
+        measures['net_count'] = ~np.isnan(net)
+        measures['delivered_revenue'] = np.where(delivered, net, 0)
+        measures['delivered_net_count'] = delivered & ~np.isnan(net)
+    for col in ['gross_amount', 'discount_amount', 'refund_amount']:
+        if col in facts.columns:
+            measures[col] = facts[col].to_numpy(dtype='float64')
+    
+    daily = {col: daily_sums(dates, values, first_day, n_days) for col, values in measures.items()}
+    for col in ['delivered', 'on_time', 'breaches']:
+        if col in fulfillment_cube.columns:
+            daily[col] = daily_sums(fulfillment_cube['order_date'], fulfillment_cube[col], first_day, n_days)
+    
+    return pd.DataFrame(
+        {col: np.concatenate([[0.0], np.cumsum(values)]) for col, values in daily.items()},
+        index=pd.date_range(first_day - pd.Timedelta(days=1), periods=n_days + 1, freq='D')
+    )
+
+@st.cache_resource(max_entries=1, show_spinner="Building KPI running totals...")
+def load_kpi_prefix_sums(signature, _tables):
+    """build_kpi_prefix_sums once per dataset version"""
+    return build_kpi_prefix_sums(*_tables)
+
+kpi_prefix_df = load_kpi_prefix_sums(data_signature, (order_facts_df, fulfillment_cube_df))
+
+def window_totals(prefix, start_date, end_date):
+    """KPI numerators and denominators summed over start_date..end_date (inclusive), as a
+    Series - two binary searches and one subtraction whatever the data size"""
+    if len(prefix) == 0:
+        return pd.Series(dtype='float64')
+    # Last row dated before the window and last row dated inside it
+    lo, hi = prefix.index.searchsorted(
+        [pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1)]
+    ) - 1
+    lo = max(lo, 0)
+    hi = max(hi, lo)
+    return prefix.iloc[hi] - prefix.iloc[lo]
+
+# ================================================================================
+# QUERY BACKEND
+# ================================================================================
+
+# Chart aggregations (aggregate / totals) run on pandas by default. Set
+# SOUQPLUS_QUERY_BACKEND=duckdb to run them as SQL on an embedded, in-process DuckDB
+# that scans the same frames in place, or =polars to run them as multi-threaded
+# Polars lazy queries. All backends return the same numbers; pandas is the
+# reference that cross_check_queries() compares Polars against.
+QUERY_BACKEND = os.environ.get('SOUQPLUS_QUERY_BACKEND', 'pandas').lower()
+
+@st.cache_resource
+def duckdb_connection():
+    """Process-wide in-memory DuckDB database (no server, no files)"""
+    import duckdb
+    return duckdb.connect()
+
+def duckdb_query(sql, params=(), **frames):
+    """Run `sql` on its own cursor with each DataFrame in `frames` registered under its name"""
+    cursor = duckdb_connection().cursor()
+    try:
+        for name, df in frames.items():
+            cursor.register(name, df)
+        return cursor.execute(sql, list(params)).df()
+    finally:
+        cursor.close()
+
+def quote(column):
+    """Quote a column name as an SQL identifier"""
+    return '"' + column.replace('"', '""') + '"'
+
+def sql_sum(df, column):
+    """SUM expression typed like pandas' sum of `column`: integer and bool columns stay
+    integers and an empty or all-missing sum is 0"""
+    is_integer = pd.api.types.is_integer_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column])
+    return f"COALESCE(SUM({quote(column)}), 0)::{'BIGINT' if is_integer else 'DOUBLE'} AS {quote(column)}"
+
+def polars_scan(df, columns, where):
+    """LazyFrame over `columns` of a pandas frame, filtered to the rows matching `where`.
+
+    Only the listed columns are converted. Categoricals become Enums so they sort in
+    category order, as they do in pandas.
+    """
+    import polars as pl
+    frame = pl.from_pandas(df[columns]).lazy()
+    enums = [
+        pl.col(col).cast(pl.Enum(df[col].cat.categories.astype(str).tolist()))
+        for col in columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    return frame.with_columns(enums).filter(*[pl.col(col) == value for col, value in where.items()])
+
+def aggregate(table, by, measures, where=None, backend=None):
+    """Sum `measures` per `by` (a column or list of columns) over the rows of `table`
+    whose columns equal the values in `where`, on `backend` (QUERY_BACKEND by default).
+
+    Matches groupby(observed=True): rows with a missing key are dropped and groups come
+    back sorted, categoricals in category order.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    where = where or {}
+    backend = backend or QUERY_BACKEND
+    if backend == 'polars':
+        import polars as pl
+        return (
+            polars_scan(table, list(dict.fromkeys(by + measures + list(where))), where)
+            .filter(*[pl.col(col).is_not_null() for col in by])
+            .group_by(by).agg(pl.col(measures).sum()).sort(by)
+            .collect().to_pandas()
+        )
+    if backend == 'duckdb':
+        keys = ', '.join(map(quote, by))
+        conditions = [f"{quote(col)} = ?" for col in where] + [f"{quote(col)} IS NOT NULL" for col in by]
+        return duckdb_query(
+            f"SELECT {keys}, {', '.join(sql_sum(table, col) for col in measures)} FROM t "
+            f"WHERE {' AND '.join(conditions)} GROUP BY {keys} ORDER BY {keys}",
+            where.values(), t=table
+        )
+    for col, value in where.items():
+        table = table[table[col] == value]
+    return table.groupby(by, observed=True)[measures].sum().reset_index()
+
+def totals(table, measures, where=None, backend=None):
+    """Sum `measures` over the rows of `table` matching `where`, as a Series"""
+    where = where or {}
+    backend = backend or QUERY_BACKEND
+    if backend == 'polars':
+        import polars as pl
+        return (
+            polars_scan(table, list(dict.fromkeys(measures + list(where))), where)
+            .select(pl.col(measures).sum()).collect().to_pandas().iloc[0]
+        )
+    if backend == 'duckdb':
+        conditions = [f"{quote(col)} = ?" for col in where] or ['TRUE']
+        return duckdb_query(
+            f"SELECT {', '.join(sql_sum(table, col) for col in measures)} FROM t WHERE {' AND '.join(conditions)}",
+            where.values(), t=table
+        ).iloc[0]
+    for col, value in where.items():
+        table = table[table[col] == value]
+    return table[measures].sum()
+
+def cross_check_queries(cubes, backend):
+    """Aggregate every measure of each cube by each of its dimensions on pandas and on
+    `backend`, and report the dimensions where the two disagree"""
+    rows = []
+    for name, cube in cubes.items():
+        measures = [col for col in cube.columns if pd.api.types.is_numeric_dtype(cube[col])
+                    and not pd.api.types.is_datetime64_any_dtype(cube[col])]
+        for dimension in cube.columns.difference(measures, sort=False):
+            reference = aggregate(cube, dimension, measures, backend='pandas')
+            candidate = aggregate(cube, dimension, measures, backend=backend)
+            rows.append({
+                'Cube': name,
+                'Dimension': dimension,
+                'Groups': len(reference),
+                'Difference': compare_frames(reference, candidate) or 'none',
+            })
+    return pd.DataFrame(rows)
+
+if QUERY_BACKEND == 'duckdb':
+    try:
+        duckdb_connection()
+    except ImportError:
+        st.error("SOUQPLUS_QUERY_BACKEND=duckdb needs the duckdb package: pip install duckdb")
+        st.stop()
+elif QUERY_BACKEND == 'polars' and importlib.util.find_spec('polars') is None:
+    st.error("SOUQPLUS_QUERY_BACKEND=polars needs the polars package: pip install polars")
+    st.stop()
+
+# ================================================================================
+# DAILY REVENUE SERIES & PERIOD BUCKETING
+# ================================================================================
+
+# The Revenue Trend chart rolls every granularity up from one cached series of delivered
+# revenue per day (and channel), so switching granularity never touches order rows.
+TREND_GRANULARITIES = ['Daily', 'Weekly', 'Monthly', 'Quarterly']
+# First day of a weekly bucket: 'monday' (ISO weeks) or 'sunday' for the Gulf Sun-Thu
+# business week. Set SOUQPLUS_WEEK_START to switch.
+WEEK_START = os.environ.get('SOUQPLUS_WEEK_START', 'monday').lower()
+
+def period_start(dates, granularity):
+    """First day of the Daily / Weekly / Monthly / Quarterly bucket of each date, computed
+    with NumPy datetime arithmetic on the whole array"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if granularity == 'Weekly':
+        # Day 0 (1970-01-01) was a Thursday, 3 days after a Monday and 4 after a Sunday
+        offset = 4 if WEEK_START == 'sunday' else 3
+        starts = days - (days.astype('int64') + offset) % 7
+    elif granularity == 'Monthly':
+        starts = days.astype('datetime64[M]').astype('datetime64[D]')
+    elif granularity == 'Quarterly':
+        months = days.astype('datetime64[M]').astype('int64')
+        starts = (months - months % 3).astype('datetime64[M]').astype('datetime64[D]')
+    else:
+        starts = days
+    return pd.DatetimeIndex(starts)
+
+def roll_up(daily, granularity, value):
+    """Sum the `value` column of a daily series into `granularity` buckets"""
+    return daily.groupby(period_start(daily['order_date'], granularity))[value].sum()
+
+def build_daily_revenue(sales_cube):
+    """Delivered revenue per order date (and channel when known), sorted by date"""
+    where = {'order_status': 'Delivered'} if 'order_status' in sales_cube.columns else {}
+    by = ['order_date'] + (['order_channel'] if 'order_channel' in sales_cube.columns else [])
+    return aggregate(sales_cube, by, ['net_amount'], where)
+
+@st.cache_resource(max_entries=1, show_spinner="Building daily revenue series...")
+def load_daily_revenue(signature, _sales_cube):
+    """build_daily_revenue once per dataset version"""
+    return build_daily_revenue(_sales_cube)
+
+daily_revenue_df = (
+    load_daily_revenue(data_signature, sales_cube_df).copy(deep=False)
+    if 'net_amount' in sales_cube_df.columns else None
+)
+
+# ================================================================================
+# SHARED RESULT CACHE
+# ================================================================================
+
+# Results of the computation graph (KPIs, chart aggregates) for recent date windows and
+# local filter values, shared by every session in the process and evicted least
+# recently used first once their estimated size exceeds the budget. Cached results are
+# read-only: callers that modify one work on a copy.
+RESULT_CACHE_MB = float(os.environ.get('SOUQPLUS_RESULT_CACHE_MB', '256'))
+
+@st.cache_resource
+def result_cache():
+    """Process-wide LRU store with its hit/miss/eviction counters"""
+    return {
+        'entries': OrderedDict(), 'bytes': 0, 'lock': threading.Lock(),
+        'hits': 0, 'misses': 0, 'evictions': 0,
+    }
+
+def result_nbytes(value):
+    """Rough in-memory size of a cached result"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(result_nbytes(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(result_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+def cache_get(key):
+    """(True, result) for a cached key, marking it most recently used, else (False, None)"""
+    cache = result_cache()
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            cache['hits'] += 1
+            return True, cache['entries'][key][0]
+        cache['misses'] += 1
+        return False, None
+
+def cache_put(key, value):
+    """Store a result, evicting least recently used entries to stay within the budget"""
+    cache = result_cache()
+    size = result_nbytes(value)
+    budget = RESULT_CACHE_MB * 1024 ** 2
+    if size > budget:
+        return
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['bytes'] -= cache['entries'].pop(key)[1]
+        cache['entries'][key] = (value, size)
+        cache['bytes'] += size
+        while cache['bytes'] > budget:
+            _, (_, evicted_size) = cache['entries'].popitem(last=False)
+            cache['bytes'] -= evicted_size
+            cache['evictions'] += 1
 
 # ================================================================================
 # CHART COLORS
@@ -433,6 +1929,58 @@ with col1:
 with col2:
     end_date = st.date_input("To", max_date, min_value=min_date, max_value=max_date)
 
+# ===== DATA ENGINE DIAGNOSTICS =====
+with st.sidebar.expander("⚙️ Data Engine"):
+    memory_report = dataset_memory_report(
+        data_signature, (customers_df, orders_df, order_items_df, fulfillment_df, returns_df)
+    )
+    typed_mb = memory_report['Typed (MB)'].sum()
+    untyped_mb = memory_report['Untyped (MB)'].sum()
+    st.caption(
+        f"Dataset in memory: {typed_mb:.1f} MB "
+        f"(saved {untyped_mb - typed_mb:.1f} MB, {untyped_mb / typed_mb:.1f}x smaller than object dtypes)"
+    )
+    st.dataframe(memory_report.round(2), use_container_width=True, hide_index=True)
+    
+    snapshot_manifest = read_snapshot_manifest()
+    if snapshot_manifest is not None and 'last_ingest' in snapshot_manifest:
+        last_ingest = snapshot_manifest['last_ingest']
+        ingested = ", ".join(f"{table} +{rows:,}" for table, rows in last_ingest['rows'].items())
+        st.caption(f"Last ingest: {last_ingest['mode']} ({ingested})")
+        if 'timings' in last_ingest:
+            timings = pd.DataFrame([
+                {'Table': table, 'Read (ms)': t['read_s'] * 1000, 'Clean (ms)': t['clean_s'] * 1000}
+                for table, t in last_ingest['timings'].items()
+            ])
+            st.caption(
+                f"Parallel load: {last_ingest['wall_s'] * 1000:.0f} ms wall on {last_ingest['workers']} workers "
+                f"vs {(timings['Read (ms)'] + timings['Clean (ms)']).sum():.0f} ms summed"
+            )
+            st.dataframe(timings.round(1), use_container_width=True, hide_index=True)
+        if last_ingest['mode'] == 'incremental' and st.button("Check snapshot against a full rebuild", key="snapshot_cross_check"):
+            st.dataframe(
+                cross_check_snapshot(data_signature, (customers_df, orders_df, order_items_df, fulfillment_df, returns_df)),
+                use_container_width=True, hide_index=True
+            )
+    
+    st.caption(f"Loader engine: {LOADER_ENGINE} (set SOUQPLUS_LOADER_ENGINE=pandas|polars)")
+    st.caption(f"Query backend: {QUERY_BACKEND} (set SOUQPLUS_QUERY_BACKEND=pandas|duckdb|polars)")
+    shared_cache = result_cache()
+    st.caption(
+        f"Result cache: {len(shared_cache['entries'])} results, "
+        f"{shared_cache['bytes'] / 1024 ** 2:.1f} of {RESULT_CACHE_MB:g} MB "
+        f"(set SOUQPLUS_RESULT_CACHE_MB) · {shared_cache['hits']:,} hits, "
+        f"{shared_cache['misses']:,} misses, {shared_cache['evictions']:,} evictions"
+    )
+    if 'polars' in (LOADER_ENGINE, QUERY_BACKEND) and st.button("Cross-check Polars against pandas", key="polars_cross_check"):
+        if LOADER_ENGINE == 'polars' and DATA_SOURCE == 'csv':
+            st.dataframe(cross_check_loader(data_signature), use_container_width=True, hide_index=True)
+        if QUERY_BACKEND == 'polars':
+            query_check = cross_check_queries(
+                {'sales': sales_cube_df, 'fulfillment': fulfillment_cube_df, 'items': item_cube_df}, 'polars'
+            )
+            st.dataframe(query_check, use_container_width=True, hide_index=True)
+
 st.sidebar.markdown("""
 <div style='background: linear-gradient(135deg, #1a2d47, #0d1b2a); 
             border: 1px solid #2a4a7f; 
@@ -460,92 +2008,120 @@ st.sidebar.markdown("""
 # BASE FILTERED DATA (Date Only)
 # ================================================================================
 
-base_filtered_orders = orders_df[
-    (orders_df['order_date'].dt.date >= start_date) &
-    (orders_df['order_date'].dt.date <= end_date)
-].copy()
-
-base_filtered_customer_ids = base_filtered_orders['customer_id'].unique()
-base_filtered_customers = customers_df[customers_df['customer_id'].isin(base_filtered_customer_ids)]
-base_filtered_order_items = order_items_df[order_items_df['order_id'].isin(base_filtered_orders['order_id'])]
-base_filtered_fulfillment = fulfillment_df[fulfillment_df['order_id'].isin(base_filtered_orders['order_id'])]
-base_filtered_returns = returns_df[returns_df['order_id'].isin(base_filtered_orders['order_id'])]
+def slice_date_window(df, date_col, start_date, end_date):
+    """Rows of a table sorted by `date_col` dated start_date..end_date (inclusive).
+
+    Two binary searches and a positional slice - no per-row date conversion and no copy.
+    """
+    if date_col not in df.columns:
+        return df
+    lo, hi = df[date_col].searchsorted([pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1)])
+    return df.iloc[lo:hi]
+
+def key_mask(keys, selected_keys, n_keys):
+    """Boolean mask of which `keys` occur in `selected_keys` (surrogate keys below n_keys).
+
+    A dense lookup table indexed by key replaces hashing ID strings; -1 (missing) keys
+    land on the spare last slot and never match.
+    """
+    lookup = np.zeros(n_keys + 1, dtype=bool)
+    selected = np.asarray(selected_keys)
+    lookup[selected[selected >= 0]] = True
+    return lookup[np.asarray(keys)]
+
+# Order facts (like orders and their child tables) are sorted by order date at load time
+base_filtered_facts = slice_date_window(order_facts_df, 'order_date', start_date, end_date)
+base_sales_cube = slice_date_window(sales_cube_df, 'order_date', start_date, end_date)
+base_fulfillment_cube = slice_date_window(fulfillment_cube_df, 'order_date', start_date, end_date)
+base_item_cube = slice_date_window(item_cube_df, 'order_date', start_date, end_date)
+base_filtered_fulfillment = slice_date_window(fulfillment_df, 'order_date', start_date, end_date)
 
 # ================================================================================
 # KPI CALCULATIONS
 # ================================================================================
 
-def calculate_executive_kpis(orders):
-    """Calculate Executive View KPIs"""
+def window_customer_counts(facts, known_only=False):
+    """(customers with an order, customers with 2+ orders) in a date-window slice of the
+    order facts, optionally only customers in the customers table.
+
+    A customer's first order in the window is the one whose previous order predates the
+    window, their second the one whose previous order is inside it but second-previous
+    is not - two vectorized date comparisons per order instead of a groupby.
+    """
+    if len(facts) == 0 or 'prev_order_date' not in facts.columns:
+        return 0, 0
+    window_start = facts['order_date'].to_numpy()[0]
+    previous_inside = facts['prev_order_date'].to_numpy() >= window_start
+    second_previous_inside = facts['prev_order_date_2'].to_numpy() >= window_start
+    first_orders = ~previous_inside
+    second_orders = previous_inside & ~second_previous_inside
+    if known_only and 'customer_key' in facts.columns:
+        known = facts['customer_key'].to_numpy() >= 0
+        first_orders &= known
+        second_orders &= known
+    return int(first_orders.sum()), int(second_orders.sum())
+
+def calculate_executive_kpis(orders, window):
+    """Calculate Executive View KPIs from the window's totals (see window_totals) and
+    customer counts (see window_customer_counts)"""
     kpis = {}
     
-    if 'order_status' in orders.columns:
-        delivered_orders = orders[orders['order_status'] == 'Delivered']
-    else:
-        delivered_orders = orders
-    
     # Total Revenue (full value stored for hover)
-    kpis['total_revenue'] = delivered_orders['net_amount'].sum() if 'net_amount' in delivered_orders.columns else 0
+    kpis['total_revenue'] = window.get('delivered_revenue', 0)
     
     # Average Order Value
-    kpis['aov'] = delivered_orders['net_amount'].mean() if len(delivered_orders) > 0 and 'net_amount' in delivered_orders.columns else 0
+    delivered_with_amount = window.get('delivered_net_count', 0)
+    kpis['aov'] = (kpis['total_revenue'] / delivered_with_amount) if delivered_with_amount > 0 else 0
     
     # Repeat Customer Rate
     if 'customer_id' in orders.columns:
-        customer_order_counts = orders.groupby('customer_id').size()
-        repeat_customers = (customer_order_counts >= 2).sum()
-        total_active = len(customer_order_counts)
+        total_active, repeat_customers = window_customer_counts(orders)
         kpis['repeat_rate'] = (repeat_customers / total_active * 100) if total_active > 0 else 0
     else:
         kpis['repeat_rate'] = 0
     
     # Discount Rate
-    if 'gross_amount' in orders.columns and 'discount_amount' in orders.columns:
-        total_gross = orders['gross_amount'].sum()
-        total_discount = orders['discount_amount'].sum()
+    if 'gross_amount' in window and 'discount_amount' in window:
+        total_gross = window['gross_amount']
+        total_discount = window['discount_amount']
         kpis['discount_rate'] = (total_discount / total_gross * 100) if total_gross > 0 else 0
     else:
         kpis['discount_rate'] = 0
     
-    kpis['total_orders'] = len(orders)
-    kpis['delivered_count'] = len(delivered_orders)
+    kpis['total_orders'] = int(window.get('orders', 0))
+    kpis['delivered_count'] = int(window.get('delivered_orders', 0))
     
     return kpis
 
-def calculate_manager_kpis(orders, fulfillment, returns):
-    """Calculate Manager View KPIs with SLA Breach Breakdown"""
+def calculate_manager_kpis(window, fulfillment_cube):
+    """Calculate Manager View KPIs from the window's totals, with the SLA Breach Breakdown
+    from the fulfillment cube"""
     kpis = {}
     
     # On-Time Delivery Rate & SLA Breach Details
-    if 'actual_delivery_date' in fulfillment.columns and 'promised_date' in fulfillment.columns:
-        delivered_fulfillment = fulfillment[fulfillment['actual_delivery_date'].notna()]
-        on_time = delivered_fulfillment[
-            delivered_fulfillment['actual_delivery_date'] <= delivered_fulfillment['promised_date']
-        ]
-        late = delivered_fulfillment[
-            delivered_fulfillment['actual_delivery_date'] > delivered_fulfillment['promised_date']
-        ]
+    if 'breaches' in window:
+        delivered_count = window['delivered']
         
-        kpis['on_time_rate'] = (len(on_time) / len(delivered_fulfillment) * 100) if len(delivered_fulfillment) > 0 else 0
-        kpis['sla_breach_count'] = len(late)
+        kpis['on_time_rate'] = (window['on_time'] / delivered_count * 100) if delivered_count > 0 else 0
+        kpis['sla_breach_count'] = int(window['breaches'])
         
         # SLA BREACH BREAKDOWN by Zone, Partner, Reason
         kpis['breach_by_zone'] = {}
         kpis['breach_by_partner'] = {}
         kpis['breach_by_reason'] = {}
         
-        if len(late) > 0:
-            if 'delivery_zone' in late.columns:
-                zone_breaches = late['delivery_zone'].value_counts().head(3).to_dict()
+        if kpis['sla_breach_count'] > 0:
+            if 'delivery_zone' in fulfillment_cube.columns:
+                zone_breaches = top_counts(fulfillment_cube, 'delivery_zone', 'breaches').head(3).to_dict()
                 kpis['breach_by_zone'] = zone_breaches
             
-            if 'delivery_partner' in late.columns:
-                partner_breaches = late['delivery_partner'].value_counts().head(3).to_dict()
+            if 'delivery_partner' in fulfillment_cube.columns:
+                partner_breaches = top_counts(fulfillment_cube, 'delivery_partner', 'breaches').head(3).to_dict()
                 kpis['breach_by_partner'] = partner_breaches
             
-            if 'delay_reason' in late.columns:
-                reason_breaches = late[late['delay_reason'] != 'No Delay']['delay_reason'].value_counts().head(3).to_dict()
-                kpis['breach_by_reason'] = reason_breaches
+            if 'delay_reason' in fulfillment_cube.columns:
+                reason_breaches = top_counts(fulfillment_cube, 'delay_reason', 'breaches').drop('No Delay', errors='ignore')
+                kpis['breach_by_reason'] = reason_breaches.head(3).to_dict()
     else:
         kpis['on_time_rate'] = 0
         kpis['sla_breach_count'] = 0
@@ -553,37 +2129,205 @@ def calculate_manager_kpis(orders, fulfillment, returns):
         kpis['breach_by_partner'] = {}
         kpis['breach_by_reason'] = {}
     
+    total_orders = int(window.get('orders', 0))
+    
     # Cancellation Rate
-    if 'order_status' in orders.columns:
-        cancelled = len(orders[orders['order_status'] == 'Cancelled'])
-        kpis['cancellation_rate'] = (cancelled / len(orders) * 100) if len(orders) > 0 else 0
+    if 'cancelled_orders' in window:
+        cancelled = int(window['cancelled_orders'])
+        kpis['cancellation_rate'] = (cancelled / total_orders * 100) if total_orders > 0 else 0
         kpis['cancelled_orders'] = cancelled
-        kpis['delivered_orders'] = len(orders[orders['order_status'] == 'Delivered'])
+        kpis['delivered_orders'] = int(window['delivered_orders'])
     else:
         kpis['cancellation_rate'] = 0
         kpis['cancelled_orders'] = 0
         kpis['delivered_orders'] = 0
     
-    # Total Refunds
-    if 'refund_status' in returns.columns and 'refund_amount' in returns.columns:
-        kpis['total_refunds'] = returns[returns['refund_status'] == 'Processed']['refund_amount'].sum()
-    elif 'refund_amount' in returns.columns:
-        kpis['total_refunds'] = returns['refund_amount'].sum()
-    else:
-        kpis['total_refunds'] = 0
+    # Total Refunds (processed refunds only, when the status is known)
+    kpis['total_refunds'] = window.get('refund_amount', 0)
     
-    kpis['total_orders'] = len(orders)
-    kpis['avg_order_value'] = orders['net_amount'].mean() if len(orders) > 0 and 'net_amount' in orders.columns else 0
+    kpis['total_orders'] = total_orders
+    orders_with_amount = window.get('net_count', 0)
+    kpis['avg_order_value'] = (window['net_amount'] / orders_with_amount) if orders_with_amount > 0 else 0
     
     return kpis
 
-# Calculate KPIs
-exec_kpis = calculate_executive_kpis(base_filtered_orders)
-mgr_kpis = calculate_manager_kpis(base_filtered_orders, base_filtered_fulfillment, base_filtered_returns)
+# ================================================================================
+# LAZY COMPUTATION GRAPH
+# ================================================================================
+
+# Window-level results are graph nodes: each declares the nodes it reads and runs only
+# when a visible section asks for it through need(), so a view or section that is not
+# shown costs nothing. Results go to the shared result cache keyed by (dataset version,
+# date window, node parameters), where parameters carry the chart-local filter values.
+COMPUTATION_NODES = {}
+
+def node(name, *inputs):
+    """Register the decorated function as graph node `name`; it is called with the
+    results of the `inputs` nodes followed by its own keyword parameters"""
+    def register(func):
+        COMPUTATION_NODES[name] = (func, inputs)
+        return func
+    return register
+
+def need(name, **params):
+    """Result of graph node `name` for the current dataset and date window, computing it
+    (and any inputs not cached) on a cache miss"""
+    key = (name, data_signature, start_date, end_date, tuple(sorted(params.items())))
+    found, result = cache_get(key)
+    if not found:
+        func, inputs = COMPUTATION_NODES[name]
+        result = func(*[need(dep) for dep in inputs], **params)
+        cache_put(key, result)
+    return result
+
+WINDOW_TABLES = {
+    'facts': base_filtered_facts, 'sales_cube': base_sales_cube,
+    'fulfillment_cube': base_fulfillment_cube, 'item_cube': base_item_cube,
+}
+
+def window_aggregate(table, by, measures, where=None):
+    """aggregate() over the date-window slice of a WINDOW_TABLES table, served from the
+    result cache; returns a copy the caller may modify"""
+    return need(
+        'aggregate', table=table, by=by if isinstance(by, str) else tuple(by),
+        measures=tuple(measures), where=tuple(sorted((where or {}).items()))
+    ).copy()
+
+@node('kpi_window')
+def kpi_window_totals():
+    """KPI numerators and denominators over the date window"""
+    return window_totals(kpi_prefix_df, start_date, end_date)
+
+@node('exec_kpis', 'kpi_window')
+def executive_kpis_node(window):
+    return calculate_executive_kpis(base_filtered_facts, window)
+
+@node('mgr_kpis', 'kpi_window')
+def manager_kpis_node(window):
+    return calculate_manager_kpis(window, base_fulfillment_cube)
+
+@node('refund_percentage', 'exec_kpis', 'mgr_kpis')
+def refund_percentage_node(exec_kpis, mgr_kpis):
+    """Refunds as % of revenue"""
+    total_revenue = exec_kpis['total_revenue']
+    return (mgr_kpis['total_refunds'] / total_revenue * 100) if total_revenue > 0 else 0
+
+@node('aggregate')
+def aggregate_node(table, by, measures, where):
+    return aggregate(WINDOW_TABLES[table], by if isinstance(by, str) else list(by), list(measures), dict(where))
+
+@node('revenue_trend')
+def revenue_trend_node(granularity, channel):
+    """Revenue per period of the date window, for one channel or 'All Channels'"""
+    rev_daily = slice_date_window(daily_revenue_df, 'order_date', start_date, end_date)
+    if channel != 'All Channels' and 'order_channel' in rev_daily.columns:
+        rev_daily = rev_daily[rev_daily['order_channel'] == channel]
+    return roll_up(rev_daily, granularity, 'net_amount').rename_axis('Date').reset_index(name='Revenue')
+
+@node('period_tiers')
+def period_tiers_node():
+    """Customer tiers re-ranked on spend inside the date window"""
+    return window_customer_tiers(base_filtered_facts, len(customers_df))
+
+@node('filtered_customers')
+def filtered_customers_node():
+    """Customers with at least one order in the date window"""
+    return customers_df[
+        key_mask(customers_df['customer_key'], base_filtered_facts['customer_key'], len(customers_df))
+    ]
+
+# ===== MATHEMATICAL MODEL COEFFICIENTS =====
+# These coefficients define the relationship between OTD and other metrics
+# Based on e-commerce industry research and benchmarks
+
+COEFFICIENTS = {
+    'cancel_reduction_per_otd': 0.04,      # 4% reduction in cancellation per 1% OTD improvement
+    'return_reduction_per_otd': 0.025,     # 2.5% reduction in returns per 1% OTD improvement
+    'nps_increase_per_otd': 1.5,           # 1.5 NPS points per 1% OTD improvement
+    'refund_reduction_per_otd': 0.05,      # 5% reduction in refunds per 1% OTD improvement
+    'repeat_increase_per_otd': 0.03,       # 3% increase in repeat rate per 1% OTD improvement
+    'investment_per_otd': 15000,           # AED 15,000 investment per 1% OTD improvement
+}
+
+# ===== SENSITIVITY MODEL =====
+SENSITIVITY_STEPS = [1.0, 0.5, 0.1, 0.05, 0.01]
+
+def evaluate_what_if(otd_delta, baseline, coefficients):
+    """Financial outcome of improving OTD by `otd_delta` points, as NumPy arrays.
+    
+    `otd_delta` and every coefficient may be a scalar or an array; they broadcast against
+    each other, so a whole grid of OTD improvements (or coefficient values) is evaluated
+    in one pass. `baseline` holds the current-state figures the model scales from.
+    """
+    otd_delta = np.asarray(otd_delta, dtype=float)
+    coef = {name: np.asarray(value, dtype=float) for name, value in coefficients.items()}
+    aov = baseline['aov']
+    
+    # Reductions are capped at 100% of what exists, as in the projection cards
+    cancel_cut = np.clip(coef['cancel_reduction_per_otd'] * otd_delta, 0, 1)
+    refund_cut = np.clip(coef['refund_reduction_per_otd'] * otd_delta, 0, 1)
+    
+    # Orders recovered from reduced cancellations (whole orders)
+    if baseline['cancel_rate'] > 0:
+        new_cancel_rate = baseline['cancel_rate'] * (1 - cancel_cut)
+        cancel_reduction_pct = (baseline['cancel_rate'] - new_cancel_rate) / baseline['cancel_rate'] * 100
+        orders_recovered = np.trunc(baseline['cancelled_orders'] * (cancel_reduction_pct / 100))
+    else:
+        orders_recovered = np.zeros(cancel_cut.shape)
+    
+    # Additional repeat orders from the higher repeat rate (whole orders, rate capped at 100%)
+    new_repeat_rate = np.minimum(100, baseline['repeat_rate'] * (1 + coef['repeat_increase_per_otd'] * otd_delta))
+    repeat_orders = np.trunc(baseline['active_customers'] * ((new_repeat_rate - baseline['repeat_rate']) / 100))
+    
+    refund_savings = baseline['refunds'] - baseline['refunds'] * (1 - refund_cut)
+    total_benefit = orders_recovered * aov + refund_savings + repeat_orders * aov
+    investment = otd_delta * coef['investment_per_otd']
+    net_benefit = total_benefit - investment
+    roi = np.where(investment > 0, net_benefit / np.where(investment > 0, investment, 1) * 100, 0.0)
+    
+    return {
+        'orders_recovered': orders_recovered, 'repeat_orders': repeat_orders,
+        'refund_savings': refund_savings, 'total_benefit': total_benefit,
+        'investment': investment, 'net_benefit': net_benefit, 'roi': roi,
+    }
 
-# Calculate Refund as % of Revenue
-total_revenue_for_refund = exec_kpis['total_revenue']
-refund_percentage = (mgr_kpis['total_refunds'] / total_revenue_for_refund * 100) if total_revenue_for_refund > 0 else 0
+def otd_delta_grid(current_otd, step, max_otd=99.0):
+    """OTD improvements from one `step` up to the largest that keeps OTD at or below `max_otd`"""
+    points = int(np.floor((max_otd - current_otd) / step + 1e-9))
+    return np.round(np.arange(1, max(points, 0) + 1) * step, 6)
+
+# ===== 2-D COEFFICIENT SENSITIVITY =====
+# Coefficients that move ROI, scanned from a quarter to twice their model value (the
+# return and NPS coefficients only move the displayed return rate and NPS score)
+HEATMAP_COEFFICIENTS = [
+    name for name in COEFFICIENTS if name not in ('return_reduction_per_otd', 'nps_increase_per_otd')
+]
+HEATMAP_TARGET_OTD = 'Target OTD'
+HEATMAP_SCALE = (0.25, 2.0)
+HEATMAP_POINTS = 41
+
+def heatmap_axis_label(axis):
+    """Readable heatmap axis name, e.g. 'investment_per_otd' -> 'Investment per OTD point'"""
+    if axis == HEATMAP_TARGET_OTD:
+        return axis
+    return axis.removesuffix('_per_otd').replace('_', ' ').capitalize() + ' per OTD point'
+
+@node('roi_heatmap')
+def roi_heatmap_node(x_axis, y_axis, otd_delta, otd_step, current_otd, baseline, coefficients):
+    """ROI over a grid of two axes (coefficients or the target OTD), evaluated by
+    broadcasting an x row against a y column; returns (x values, y values, ROI matrix)"""
+    coefficients = dict(coefficients)
+    
+    def axis_values(axis):
+        if axis == HEATMAP_TARGET_OTD:
+            return current_otd + otd_delta_grid(current_otd, otd_step)
+        return np.linspace(*HEATMAP_SCALE, HEATMAP_POINTS) * coefficients[axis]
+    
+    x_values, y_values = axis_values(x_axis), axis_values(y_axis)
+    grid = {x_axis: x_values[np.newaxis, :], y_axis: y_values[:, np.newaxis]}
+    delta = grid.pop(HEATMAP_TARGET_OTD) - current_otd if HEATMAP_TARGET_OTD in grid else otd_delta
+    roi = evaluate_what_if(delta, dict(baseline), {**coefficients, **grid})['roi']
+    return x_values, y_values, np.broadcast_to(roi, (len(y_values), len(x_values)))
 
 # ================================================================================
 # MAIN HEADER
@@ -610,8 +2354,13 @@ st.markdown(f"""
 # EXECUTIVE VIEW
 # ================================================================================
 
+# Each chart with its own filters (and the What-If projection) is an st.fragment:
+# changing one of its widgets reruns and re-sends only that chart, while the date
+# range, KPIs and every other chart keep the results of the last full run.
 if view_mode == "Executive View":
     
+    exec_kpis = need('exec_kpis')
+    
     # ===== 4 KPI CARDS (Clean - No Deltas) =====
     st.markdown("### 📈 Key Performance Indicators")
     
@@ -659,79 +2408,73 @@ if view_mode == "Executive View":
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
     # ===== CHART 1: REVENUE TREND (with local filter) =====
-    st.markdown("### 📊 Revenue Trend")
-    
-    # LOCAL FILTER for Revenue Trend
-    rev_col1, rev_col2, rev_col3 = st.columns([1, 1, 2])
-    
-    with rev_col1:
-        rev_agg_type = st.selectbox("Aggregation", ["Weekly", "Monthly"], key="rev_trend_agg")
-    
-    with rev_col2:
-        rev_channel_options = ['All Channels'] + list(base_filtered_orders['order_channel'].unique()) if 'order_channel' in base_filtered_orders.columns else ['All Channels']
-        rev_channel_filter = st.selectbox("Channel", rev_channel_options, key="rev_trend_channel")
-    
-    # Apply local filter
-    rev_trend_data = base_filtered_orders.copy()
-    if rev_channel_filter != 'All Channels' and 'order_channel' in rev_trend_data.columns:
-        rev_trend_data = rev_trend_data[rev_trend_data['order_channel'] == rev_channel_filter]
-    
-    if 'order_status' in rev_trend_data.columns:
-        delivered = rev_trend_data[rev_trend_data['order_status'] == 'Delivered'].copy()
-    else:
-        delivered = rev_trend_data.copy()
-    
-    if len(delivered) > 0 and 'net_amount' in delivered.columns:
-        if rev_agg_type == "Weekly":
-            delivered['period'] = delivered['order_date'].dt.to_period('W').apply(lambda x: x.start_time)
-        else:
-            delivered['period'] = delivered['order_date'].dt.to_period('M').apply(lambda x: x.start_time)
+    @st.fragment
+    def revenue_trend_chart():
+        """Revenue Trend with its Aggregation and Channel filters"""
+        st.markdown("### 📊 Revenue Trend")
         
-        revenue_trend = delivered.groupby('period')['net_amount'].sum().reset_index()
-        revenue_trend.columns = ['Date', 'Revenue']
+        # LOCAL FILTER for Revenue Trend
+        rev_col1, rev_col2, rev_col3 = st.columns([1, 1, 2])
         
-        fig = px.line(revenue_trend, x='Date', y='Revenue', markers=True,
-                     color_discrete_sequence=[COLORS['primary']])
-        fig.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-            font_color='#e8e8e8',
-            xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title=''),
-            yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Revenue (AED)'),
-            margin=dict(l=0, r=0, t=20, b=0)
-        )
-        fig.update_traces(line=dict(width=3), marker=dict(size=8))
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No delivered orders in selected period.")
-    
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== CHART 2 & 3: Revenue by City & Channel Contribution =====
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("### 🏙️ Revenue by City")
+        with rev_col1:
+            rev_agg_type = st.selectbox(
+                "Aggregation", TREND_GRANULARITIES, index=TREND_GRANULARITIES.index("Weekly"), key="rev_trend_agg"
+            )
         
-        # LOCAL FILTER for City Chart
-        city_segment_options = ['All Segments'] + list(customers_df['customer_segment'].unique()) if 'customer_segment' in customers_df.columns else ['All Segments']
-        city_segment_filter = st.selectbox("Customer Segment", city_segment_options, key="city_segment_filter")
+        with rev_col2:
+            rev_channel_options = ['All Channels'] + sorted(base_filtered_facts['order_channel'].unique()) if 'order_channel' in base_filtered_facts.columns else ['All Channels']
+            rev_channel_filter = st.selectbox("Channel", rev_channel_options, key="rev_trend_channel")
         
         # Apply local filter
-        city_filtered_customers = base_filtered_customers.copy()
-        if city_segment_filter != 'All Segments' and 'customer_segment' in city_filtered_customers.columns:
-            city_filtered_customers = city_filtered_customers[city_filtered_customers['customer_segment'] == city_segment_filter]
-        
-        city_filtered_orders = base_filtered_orders[base_filtered_orders['customer_id'].isin(city_filtered_customers['customer_id'])]
+        revenue_trend = pd.DataFrame()
+        if daily_revenue_df is not None:
+            revenue_trend = need('revenue_trend', granularity=rev_agg_type, channel=rev_channel_filter)
         
-        if 'city' in customers_df.columns:
-            city_revenue = city_filtered_orders.merge(customers_df[['customer_id', 'city']], on='customer_id')
-            if 'order_status' in city_revenue.columns:
-                city_revenue = city_revenue[city_revenue['order_status'] == 'Delivered']
+        if len(revenue_trend) > 0:
             
-            if len(city_revenue) > 0 and 'net_amount' in city_revenue.columns:
-                city_agg = city_revenue.groupby('city')['net_amount'].sum().reset_index()
-                city_agg.columns = ['City', 'Revenue']
-                city_agg = city_agg.sort_values('Revenue', ascending=True)
+            fig = px.line(revenue_trend, x='Date', y='Revenue', markers=True,
+                         color_discrete_sequence=[COLORS['primary']])
+            fig.update_layout(
+                plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                font_color='#e8e8e8',
+                xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title=''),
+                yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Revenue (AED)'),
+                margin=dict(l=0, r=0, t=20, b=0)
+            )
+            fig.update_traces(line=dict(width=3), marker=dict(size=8))
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No delivered orders in selected period.")
+    
+    revenue_trend_chart()
+    
+    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+    
+    # ===== CHART 2 & 3: Revenue by City & Channel Contribution =====
+    @st.fragment
+    def city_revenue_chart():
+        """Revenue by City with its Customer Segment filter"""
+        st.markdown("### 🏙️ Revenue by City")
+        
+        # LOCAL FILTER for City Chart
+        city_segment_options = ['All Segments'] + list(customers_df['customer_segment'].unique()) if 'customer_segment' in customers_df.columns else ['All Segments']
+        city_segment_filter = st.selectbox("Customer Segment", city_segment_options, key="city_segment_filter")
+        
+        # Apply local filter
+        city_where = {}
+        if city_segment_filter != 'All Segments' and 'customer_segment' in base_sales_cube.columns:
+            city_where['customer_segment'] = city_segment_filter
+        if 'order_status' in base_sales_cube.columns:
+            city_where['order_status'] = 'Delivered'
+        
+        if 'city' in base_sales_cube.columns:
+            city_agg = pd.DataFrame()
+            if 'net_amount' in base_sales_cube.columns:
+                city_agg = window_aggregate('sales_cube', 'city', ['net_amount'], city_where)
+            
+            if len(city_agg) > 0:
+                city_agg.columns = ['City', 'Revenue']
+                city_agg = city_agg.sort_values('Revenue', ascending=True)
                 
                 fig = px.bar(city_agg, x='Revenue', y='City', orientation='h',
                             color='Revenue', color_continuous_scale=['#1a2d47', '#3a86ff', '#4cc9f0'])
@@ -748,7 +2491,9 @@ if view_mode == "Executive View":
         else:
             st.info("City data not available.")
     
-    with col2:
+    @st.fragment
+    def channel_contribution_chart():
+        """Channel Contribution with its City filter"""
         st.markdown("### 📱 Channel Contribution")
         
         # LOCAL FILTER for Channel Chart
@@ -756,15 +2501,15 @@ if view_mode == "Executive View":
         channel_city_filter = st.selectbox("City", channel_city_options, key="channel_city_filter")
         
         # Apply local filter
-        channel_filtered_orders = base_filtered_orders.copy()
-        if channel_city_filter != 'All Cities' and 'city' in customers_df.columns:
-            city_customer_ids = customers_df[customers_df['city'] == channel_city_filter]['customer_id']
-            channel_filtered_orders = channel_filtered_orders[channel_filtered_orders['customer_id'].isin(city_customer_ids)]
-        
-        if len(channel_filtered_orders) > 0 and 'order_channel' in channel_filtered_orders.columns:
-            channel_orders = channel_filtered_orders.groupby('order_channel').agg({
-                'order_id': 'count', 'net_amount': 'sum'
-            }).reset_index()
+        channel_where = {}
+        if channel_city_filter != 'All Cities' and 'city' in base_sales_cube.columns:
+            channel_where['city'] = channel_city_filter
+        
+        channel_orders = pd.DataFrame()
+        if 'order_channel' in base_sales_cube.columns:
+            channel_orders = window_aggregate('sales_cube', 'order_channel', ['orders', 'net_amount'], channel_where)
+        
+        if len(channel_orders) > 0:
             channel_orders.columns = ['Channel', 'Orders', 'Revenue']
             
             fig = px.pie(channel_orders, values='Orders', names='Channel',
@@ -778,112 +2523,143 @@ if view_mode == "Executive View":
         else:
             st.info("No channel data available.")
     
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== CHART 4: Category Revenue by City =====
-    st.markdown("### 🛍️ Category Revenue Analysis")
-    
-    # LOCAL FILTERS for Category Chart
-    cat_col1, cat_col2, cat_col3 = st.columns([1, 1, 2])
-    
-    with cat_col1:
-        cat_city_options = ['All Cities'] + list(customers_df['city'].unique()) if 'city' in customers_df.columns else ['All Cities']
-        cat_city_filter = st.selectbox("Filter by City", cat_city_options, key="cat_city_filter")
-    
-    with cat_col2:
-        cat_channel_options = ['All Channels'] + list(base_filtered_orders['order_channel'].unique()) if 'order_channel' in base_filtered_orders.columns else ['All Channels']
-        cat_channel_filter = st.selectbox("Filter by Channel", cat_channel_options, key="cat_channel_filter")
-    
-    # Apply local filters
-    cat_filtered_orders = base_filtered_orders.copy()
-    if cat_city_filter != 'All Cities' and 'city' in customers_df.columns:
-        city_customers = customers_df[customers_df['city'] == cat_city_filter]['customer_id']
-        cat_filtered_orders = cat_filtered_orders[cat_filtered_orders['customer_id'].isin(city_customers)]
-    
-    if cat_channel_filter != 'All Channels' and 'order_channel' in cat_filtered_orders.columns:
-        cat_filtered_orders = cat_filtered_orders[cat_filtered_orders['order_channel'] == cat_channel_filter]
+    col1, col2 = st.columns(2)
     
-    cat_filtered_items = base_filtered_order_items[base_filtered_order_items['order_id'].isin(cat_filtered_orders['order_id'])]
+    with col1:
+        city_revenue_chart()
     
-    if 'product_category' in cat_filtered_items.columns and len(cat_filtered_items) > 0:
-        cat_revenue = cat_filtered_items.groupby('product_category')['item_total'].sum().reset_index()
-        cat_revenue.columns = ['Category', 'Revenue']
-        cat_revenue = cat_revenue.sort_values('Revenue', ascending=False)
-        
-        fig = px.bar(cat_revenue, x='Category', y='Revenue', color='Category',
-                    color_discrete_sequence=CHART_COLORS)
-        fig.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-            font_color='#e8e8e8', showlegend=False,
-            xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title=''),
-            yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Revenue (AED)'),
-            margin=dict(l=0, r=0, t=20, b=0)
-        )
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No category data available.")
+    with col2:
+        channel_contribution_chart()
     
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
-    # ===== CUSTOMER TIER DISTRIBUTION =====
-    st.markdown("### 👑 Customer Tier Distribution")
-    
-    # LOCAL FILTER for Tier Chart
-    tier_col1, tier_col2, _ = st.columns([1, 1, 2])
-    
-    with tier_col1:
-        tier_city_options = ['All Cities'] + list(customers_df['city'].unique()) if 'city' in customers_df.columns else ['All Cities']
-        tier_city_filter = st.selectbox("Filter by City", tier_city_options, key="tier_city_filter")
-    
-    # Apply local filter
-    tier_filtered_customers = base_filtered_customers.copy()
-    if tier_city_filter != 'All Cities' and 'city' in tier_filtered_customers.columns:
-        tier_filtered_customers = tier_filtered_customers[tier_filtered_customers['city'] == tier_city_filter]
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if 'customer_tier' in tier_filtered_customers.columns:
-            tier_dist = tier_filtered_customers['customer_tier'].value_counts().reset_index()
-            tier_dist.columns = ['Tier', 'Count']
-            tier_order = ['Bronze', 'Silver', 'Gold', 'Platinum']
-            tier_dist['Tier'] = pd.Categorical(tier_dist['Tier'], categories=tier_order, ordered=True)
-            tier_dist = tier_dist.sort_values('Tier')
+    # ===== CHART 4: Category Revenue by City =====
+    @st.fragment
+    def category_revenue_chart():
+        """Category Revenue with its City and Channel filters"""
+        st.markdown("### 🛍️ Category Revenue Analysis")
+        
+        # LOCAL FILTERS for Category Chart
+        cat_col1, cat_col2, cat_col3 = st.columns([1, 1, 2])
+        
+        with cat_col1:
+            cat_city_options = ['All Cities'] + list(customers_df['city'].unique()) if 'city' in customers_df.columns else ['All Cities']
+            cat_city_filter = st.selectbox("Filter by City", cat_city_options, key="cat_city_filter")
+        
+        with cat_col2:
+            cat_channel_options = ['All Channels'] + sorted(base_filtered_facts['order_channel'].unique()) if 'order_channel' in base_filtered_facts.columns else ['All Channels']
+            cat_channel_filter = st.selectbox("Filter by Channel", cat_channel_options, key="cat_channel_filter")
+        
+        # Apply local filters
+        cat_where = {}
+        if cat_city_filter != 'All Cities' and 'city' in base_item_cube.columns:
+            cat_where['city'] = cat_city_filter
+        if cat_channel_filter != 'All Channels' and 'order_channel' in base_item_cube.columns:
+            cat_where['order_channel'] = cat_channel_filter
+        
+        cat_revenue = pd.DataFrame()
+        if 'product_category' in base_item_cube.columns:
+            cat_revenue = window_aggregate('item_cube', 'product_category', ['item_total'], cat_where)
+        
+        if len(cat_revenue) > 0:
+            cat_revenue.columns = ['Category', 'Revenue']
+            cat_revenue = cat_revenue.sort_values('Revenue', ascending=False)
             
-            fig = px.bar(tier_dist, x='Tier', y='Count', color='Tier',
-                        color_discrete_map=TIER_COLORS)
+            fig = px.bar(cat_revenue, x='Category', y='Revenue', color='Category',
+                        color_discrete_sequence=CHART_COLORS)
             fig.update_layout(
                 plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
                 font_color='#e8e8e8', showlegend=False,
-                xaxis=dict(title=''), yaxis=dict(title='Customers', gridcolor='rgba(58,134,255,0.1)'),
+                xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title=''),
+                yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Revenue (AED)'),
                 margin=dict(l=0, r=0, t=20, b=0)
             )
             st.plotly_chart(fig, use_container_width=True)
         else:
-            st.info("Customer tier data not available.")
+            st.info("No category data available.")
     
-    with col2:
-        if 'customer_tier' in customers_df.columns:
-            tier_customer_ids = tier_filtered_customers['customer_id']
-            tier_orders = base_filtered_orders[base_filtered_orders['customer_id'].isin(tier_customer_ids)]
-            tier_revenue = tier_orders.merge(customers_df[['customer_id', 'customer_tier']], on='customer_id')
-            tier_rev_agg = tier_revenue.groupby('customer_tier')['net_amount'].sum().reset_index()
-            tier_rev_agg.columns = ['Tier', 'Revenue']
-            tier_order = ['Bronze', 'Silver', 'Gold', 'Platinum']
-            tier_rev_agg['Tier'] = pd.Categorical(tier_rev_agg['Tier'], categories=tier_order, ordered=True)
-            tier_rev_agg = tier_rev_agg.sort_values('Tier')
-            
-            fig = px.bar(tier_rev_agg, x='Tier', y='Revenue', color='Tier',
-                        color_discrete_map=TIER_COLORS)
-            fig.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-                font_color='#e8e8e8', showlegend=False,
-                xaxis=dict(title=''), yaxis=dict(title='Revenue (AED)', gridcolor='rgba(58,134,255,0.1)'),
-                margin=dict(l=0, r=0, t=20, b=0)
-            )
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Customer tier data not available.")
+    category_revenue_chart()
+    
+    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+    
+    # ===== CUSTOMER TIER DISTRIBUTION =====
+    @st.fragment
+    def customer_tier_charts():
+        """Tier distribution and revenue with their City and Tier Basis filters"""
+        st.markdown("### 👑 Customer Tier Distribution")
+        
+        # LOCAL FILTER for Tier Chart
+        tier_col1, tier_col2, _ = st.columns([1, 1, 2])
+        
+        with tier_col1:
+            tier_city_options = ['All Cities'] + list(customers_df['city'].unique()) if 'city' in customers_df.columns else ['All Cities']
+            tier_city_filter = st.selectbox("Filter by City", tier_city_options, key="tier_city_filter")
+        
+        with tier_col2:
+            tier_basis = st.selectbox("Tier Basis", ["Lifetime Spend", "Selected Period Spend"], key="tier_basis_filter")
+        
+        # Apply local filter
+        tier_filtered_customers = need('filtered_customers').copy()
+        period_tiers = None
+        if tier_basis == "Selected Period Spend" and 'net_amount' in base_filtered_facts.columns:
+            # Re-tier on spend inside the sidebar date window only
+            period_tiers = need('period_tiers')
+            tier_filtered_customers['customer_tier'] = period_tiers[tier_filtered_customers['customer_key'].to_numpy()]
+        if tier_city_filter != 'All Cities' and 'city' in tier_filtered_customers.columns:
+            tier_filtered_customers = tier_filtered_customers[tier_filtered_customers['city'] == tier_city_filter]
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if 'customer_tier' in tier_filtered_customers.columns:
+                tier_dist = observed_counts(tier_filtered_customers['customer_tier']).reset_index()
+                tier_dist.columns = ['Tier', 'Count']
+                tier_dist['Tier'] = pd.Categorical(tier_dist['Tier'], categories=TIER_LABELS, ordered=True)
+                tier_dist = tier_dist.sort_values('Tier')
+                
+                fig = px.bar(tier_dist, x='Tier', y='Count', color='Tier',
+                            color_discrete_map=TIER_COLORS)
+                fig.update_layout(
+                    plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                    font_color='#e8e8e8', showlegend=False,
+                    xaxis=dict(title=''), yaxis=dict(title='Customers', gridcolor='rgba(58,134,255,0.1)'),
+                    margin=dict(l=0, r=0, t=20, b=0)
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Customer tier data not available.")
+        
+        with col2:
+            if 'customer_tier' in customers_df.columns:
+                if period_tiers is not None:
+                    # Period tiers come from per-customer spend, which the sales cube doesn't keep
+                    tier_revenue = base_filtered_facts[
+                        key_mask(base_filtered_facts['customer_key'], tier_filtered_customers['customer_key'], len(customers_df))
+                    ]
+                    tier_revenue = tier_revenue.assign(customer_tier=period_tiers[tier_revenue['customer_key'].to_numpy()])
+                    tier_rev_agg = aggregate(tier_revenue, 'customer_tier', ['net_amount'])
+                else:
+                    tier_where = {}
+                    if tier_city_filter != 'All Cities' and 'city' in base_sales_cube.columns:
+                        tier_where['city'] = tier_city_filter
+                    tier_rev_agg = window_aggregate('sales_cube', 'customer_tier', ['net_amount'], tier_where)
+                tier_rev_agg.columns = ['Tier', 'Revenue']
+                tier_rev_agg['Tier'] = pd.Categorical(tier_rev_agg['Tier'], categories=TIER_LABELS, ordered=True)
+                tier_rev_agg = tier_rev_agg.sort_values('Tier')
+                
+                fig = px.bar(tier_rev_agg, x='Tier', y='Revenue', color='Tier',
+                            color_discrete_map=TIER_COLORS)
+                fig.update_layout(
+                    plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                    font_color='#e8e8e8', showlegend=False,
+                    xaxis=dict(title=''), yaxis=dict(title='Revenue (AED)', gridcolor='rgba(58,134,255,0.1)'),
+                    margin=dict(l=0, r=0, t=20, b=0)
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Customer tier data not available.")
+    
+    customer_tier_charts()
     
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
@@ -892,19 +2668,18 @@ if view_mode == "Executive View":
     
     # Calculate insights
     top_city, top_city_rev = "N/A", 0
-    if 'city' in customers_df.columns:
-        city_revenue = base_filtered_orders.merge(customers_df[['customer_id', 'city']], on='customer_id')
-        if 'order_status' in city_revenue.columns:
-            city_revenue = city_revenue[city_revenue['order_status'] == 'Delivered']
-        if len(city_revenue) > 0:
-            city_agg = city_revenue.groupby('city')['net_amount'].sum()
-            if len(city_agg) > 0:
-                top_city = city_agg.idxmax()
-                top_city_rev = city_agg.max()
+    if 'city' in base_sales_cube.columns:
+        insight_where = {'order_status': 'Delivered'} if 'order_status' in base_sales_cube.columns else {}
+        city_agg = window_aggregate('sales_cube', 'city', ['net_amount'], insight_where).set_index('city')['net_amount']
+        if len(city_agg) > 0:
+            top_city = city_agg.idxmax()
+            top_city_rev = city_agg.max()
     
     top_channel = "N/A"
-    if 'order_channel' in base_filtered_orders.columns:
-        top_channel = base_filtered_orders['order_channel'].value_counts().idxmax()
+    if 'order_channel' in base_sales_cube.columns:
+        channel_agg = window_aggregate('sales_cube', 'order_channel', ['orders']).set_index('order_channel')['orders']
+        if len(channel_agg) > 0:
+            top_channel = channel_agg.idxmax()
     
     st.markdown(f"""
     <div class='insight-box'>
@@ -925,6 +2700,9 @@ if view_mode == "Executive View":
 
 else:
     
+    mgr_kpis = need('mgr_kpis')
+    refund_percentage = need('refund_percentage')
+    
     # ===== 4 KPI CARDS (Clean - No Deltas) WITH BREACH BREAKDOWN =====
     st.markdown("### 🔧 Operational KPIs")
     
@@ -1009,29 +2787,25 @@ else:
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
     # ===== CHART 1 & 2: SLA Breach Trend & Breaches by Zone =====
-    col1, col2 = st.columns(2)
-    
-    with col1:
+    @st.fragment
+    def breach_trend_chart():
+        """SLA Breach Trend with its Partner filter"""
         st.markdown("### 📈 SLA Breach Trend")
         
         # LOCAL FILTER
-        breach_partner_options = ['All Partners'] + list(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
+        breach_partner_options = ['All Partners'] + sorted(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
         breach_partner_filter = st.selectbox("Filter by Partner", breach_partner_options, key="breach_partner_filter")
         
-        breach_data = base_filtered_fulfillment.copy()
-        if breach_partner_filter != 'All Partners' and 'delivery_partner' in breach_data.columns:
-            breach_data = breach_data[breach_data['delivery_partner'] == breach_partner_filter]
+        breach_where = {}
+        if breach_partner_filter != 'All Partners' and 'delivery_partner' in base_fulfillment_cube.columns:
+            breach_where['delivery_partner'] = breach_partner_filter
         
-        if 'actual_delivery_date' in breach_data.columns and 'promised_date' in breach_data.columns:
-            breach_data = breach_data[
-                (breach_data['actual_delivery_date'].notna()) &
-                (breach_data['actual_delivery_date'] > breach_data['promised_date'])
-            ].copy()
+        if 'breaches' in base_fulfillment_cube.columns:
+            breach_trend = window_aggregate('fulfillment_cube', 'actual_delivery_date', ['breaches'], breach_where)
+            breach_trend = breach_trend[breach_trend['breaches'] > 0]
             
-            if len(breach_data) > 0:
-                breach_trend = breach_data.groupby(
-                    breach_data['actual_delivery_date'].dt.date
-                ).size().reset_index()
+            if len(breach_trend) > 0:
+                breach_trend['actual_delivery_date'] = breach_trend['actual_delivery_date'].dt.date
                 breach_trend.columns = ['Date', 'Breaches']
                 
                 fig = px.line(breach_trend, x='Date', y='Breaches', markers=True,
@@ -1049,25 +2823,26 @@ else:
         else:
             st.info("Delivery date data not available.")
     
-    with col2:
+    @st.fragment
+    def zone_breaches_chart():
+        """Breaches by Zone with its Partner filter"""
         st.markdown("### 📍 Breaches by Zone (Top 10)")
         
         # LOCAL FILTER
-        zone_partner_options = ['All Partners'] + list(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
+        zone_partner_options = ['All Partners'] + sorted(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
         zone_partner_filter = st.selectbox("Filter by Partner", zone_partner_options, key="zone_partner_filter")
         
-        zone_breach_data = base_filtered_fulfillment.copy()
-        if zone_partner_filter != 'All Partners' and 'delivery_partner' in zone_breach_data.columns:
-            zone_breach_data = zone_breach_data[zone_breach_data['delivery_partner'] == zone_partner_filter]
+        zone_breach_where = {}
+        if zone_partner_filter != 'All Partners' and 'delivery_partner' in base_fulfillment_cube.columns:
+            zone_breach_where['delivery_partner'] = zone_partner_filter
         
-        if 'actual_delivery_date' in zone_breach_data.columns and 'promised_date' in zone_breach_data.columns:
-            zone_breach_data = zone_breach_data[
-                (zone_breach_data['actual_delivery_date'].notna()) &
-                (zone_breach_data['actual_delivery_date'] > zone_breach_data['promised_date'])
-            ]
+        if 'breaches' in base_fulfillment_cube.columns:
+            zone_breaches = pd.DataFrame()
+            if 'delivery_zone' in base_fulfillment_cube.columns:
+                zone_breaches = window_aggregate('fulfillment_cube', 'delivery_zone', ['breaches'], zone_breach_where)
+                zone_breaches = zone_breaches[zone_breaches['breaches'] > 0]
             
-            if len(zone_breach_data) > 0 and 'delivery_zone' in zone_breach_data.columns:
-                zone_breaches = zone_breach_data.groupby('delivery_zone').size().reset_index()
+            if len(zone_breaches) > 0:
                 zone_breaches.columns = ['Zone', 'Breaches']
                 zone_breaches = zone_breaches.sort_values('Breaches', ascending=False).head(10)
                 zone_breaches = zone_breaches.sort_values('Breaches', ascending=True)
@@ -1087,32 +2862,35 @@ else:
         else:
             st.info("Delivery data not available.")
     
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== CHART 3 & 4: Pareto & Return Rate =====
     col1, col2 = st.columns(2)
     
     with col1:
+        breach_trend_chart()
+    
+    with col2:
+        zone_breaches_chart()
+    
+    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+    
+    # ===== CHART 3 & 4: Pareto & Return Rate =====
+    @st.fragment
+    def delay_pareto_chart():
+        """Delay Reasons Pareto with its Zone filter"""
         st.markdown("### ⚠️ Delay Reasons (Pareto)")
         
         # LOCAL FILTER
-        delay_zone_options = ['All Zones'] + list(base_filtered_fulfillment['delivery_zone'].dropna().unique()) if 'delivery_zone' in base_filtered_fulfillment.columns else ['All Zones']
+        delay_zone_options = ['All Zones'] + sorted(base_filtered_fulfillment['delivery_zone'].dropna().unique()) if 'delivery_zone' in base_filtered_fulfillment.columns else ['All Zones']
         delay_zone_filter = st.selectbox("Filter by Zone", delay_zone_options, key="delay_zone_filter")
         
-        delay_data = base_filtered_fulfillment.copy()
-        if delay_zone_filter != 'All Zones' and 'delivery_zone' in delay_data.columns:
-            delay_data = delay_data[delay_data['delivery_zone'] == delay_zone_filter]
-        
-        if 'delay_reason' in delay_data.columns:
-            delay_data = delay_data[
-                (delay_data['delay_reason'].notna()) &
-                (delay_data['delay_reason'] != 'No Delay') &
-                (delay_data['delay_reason'] != 'Order Cancelled') &
-                (delay_data['delay_reason'] != '')
-            ]
+        delay_where = {}
+        if delay_zone_filter != 'All Zones' and 'delivery_zone' in base_fulfillment_cube.columns:
+            delay_where['delivery_zone'] = delay_zone_filter
+        
+        if 'delay_reason' in base_fulfillment_cube.columns:
+            delay_reasons = window_aggregate('fulfillment_cube', 'delay_reason', ['deliveries'], delay_where)
+            delay_reasons = delay_reasons[~delay_reasons['delay_reason'].isin(['No Delay', 'Order Cancelled', ''])]
             
-            if len(delay_data) > 0:
-                delay_reasons = delay_data.groupby('delay_reason').size().reset_index()
+            if len(delay_reasons) > 0:
                 delay_reasons.columns = ['Reason', 'Count']
                 delay_reasons = delay_reasons.sort_values('Count', ascending=False)
                 delay_reasons['Cumulative'] = delay_reasons['Count'].cumsum()
@@ -1149,7 +2927,9 @@ else:
         else:
             st.info("Delay reason data not available.")
     
-    with col2:
+    @st.fragment
+    def return_rate_chart():
+        """Return Rate by Category with its City filter"""
         st.markdown("### ↩️ Return Rate by Category")
         
         # LOCAL FILTER
@@ -1157,27 +2937,17 @@ else:
         return_city_filter = st.selectbox("Filter by City", return_city_options, key="return_city_filter")
         
         # Apply local filter
-        return_filtered_orders = base_filtered_orders.copy()
-        if return_city_filter != 'All Cities' and 'city' in customers_df.columns:
-            city_customers = customers_df[customers_df['city'] == return_city_filter]['customer_id']
-            return_filtered_orders = return_filtered_orders[return_filtered_orders['customer_id'].isin(city_customers)]
-        
-        return_filtered_items = base_filtered_order_items[base_filtered_order_items['order_id'].isin(return_filtered_orders['order_id'])]
-        return_filtered_returns = base_filtered_returns[base_filtered_returns['order_id'].isin(return_filtered_orders['order_id'])]
-        
-        if 'product_category' in return_filtered_items.columns and len(return_filtered_returns) > 0:
-            returns_cat = return_filtered_returns.merge(
-                return_filtered_items[['order_id', 'product_category']].drop_duplicates('order_id'),
-                on='order_id', how='left'
-            )
-            
-            cat_returns = returns_cat.groupby('product_category').size().reset_index()
-            cat_returns.columns = ['Category', 'Returns']
-            
-            cat_orders = return_filtered_items.groupby('product_category')['order_id'].nunique().reset_index()
-            cat_orders.columns = ['Category', 'Orders']
-            
-            return_rate = cat_returns.merge(cat_orders, on='Category')
+        return_where = {}
+        if return_city_filter != 'All Cities' and 'city' in base_item_cube.columns:
+            return_where['city'] = return_city_filter
+        
+        return_rate = pd.DataFrame()
+        if 'returns' in base_item_cube.columns:
+            return_rate = window_aggregate('item_cube', 'product_category', ['returns', 'orders'], return_where)
+        
+        if len(return_rate) > 0 and return_rate['returns'].sum() > 0:
+            return_rate = return_rate[return_rate['returns'] > 0]
+            return_rate.columns = ['Category', 'Returns', 'Orders']
             return_rate['Return Rate'] = (return_rate['Returns'] / return_rate['Orders'] * 100).round(2)
             return_rate = return_rate.sort_values('Return Rate', ascending=False)
             
@@ -1199,156 +2969,179 @@ else:
         else:
             st.info("Return or category data not available.")
     
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        delay_pareto_chart()
+    
+    with col2:
+        return_rate_chart()
+    
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
     # ===== SORTABLE TABLE =====
-    st.markdown("### 📋 Top 10 Problem Areas (Sortable)")
-    
-    # LOCAL FILTER
-    table_col1, table_col2, _ = st.columns([1, 1, 2])
-    
-    with table_col1:
-        table_partner_options = ['All Partners'] + list(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
-        table_partner_filter = st.selectbox("Filter by Partner", table_partner_options, key="table_partner_filter")
-    
-    # Apply local filter
-    table_data = base_filtered_fulfillment.copy()
-    if table_partner_filter != 'All Partners' and 'delivery_partner' in table_data.columns:
-        table_data = table_data[table_data['delivery_partner'] == table_partner_filter]
-    
-    if 'delivery_zone' in table_data.columns and 'actual_delivery_date' in table_data.columns:
-        zone_analysis = table_data.copy()
-        zone_analysis['is_breach'] = zone_analysis['actual_delivery_date'] > zone_analysis['promised_date']
-        zone_analysis['delay_days'] = (zone_analysis['actual_delivery_date'] - zone_analysis['promised_date']).dt.days
-        zone_analysis.loc[zone_analysis['delay_days'] < 0, 'delay_days'] = 0
-        
-        problem_zones = zone_analysis.groupby('delivery_zone').agg({
-            'is_breach': 'sum',
-            'delay_days': 'mean',
-            'delay_reason': lambda x: x.mode().iloc[0] if len(x.mode()) > 0 else 'N/A',
-            'order_id': 'count'
-        }).reset_index()
-        problem_zones.columns = ['Delivery Zone', 'SLA Breaches', 'Avg Delay Days', 'Top Delay Reason', 'Total Orders']
-        problem_zones = problem_zones.sort_values('SLA Breaches', ascending=False).head(10)
-        problem_zones['Avg Delay Days'] = problem_zones['Avg Delay Days'].round(1)
-        
-        st.dataframe(
-            problem_zones,
-            use_container_width=True,
-            column_config={
-                "Delivery Zone": st.column_config.TextColumn("Delivery Zone"),
-                "SLA Breaches": st.column_config.NumberColumn("SLA Breaches", format="%d"),
-                "Avg Delay Days": st.column_config.NumberColumn("Avg Delay (Days)", format="%.1f"),
-                "Top Delay Reason": st.column_config.TextColumn("Primary Reason"),
-                "Total Orders": st.column_config.NumberColumn("Total Orders", format="%d")
-            }
-        )
-    else:
-        st.info("Zone analysis data not available.")
+    @st.fragment
+    def problem_areas_table():
+        """Top 10 Problem Areas with its Partner and Reasons per Zone filters"""
+        st.markdown("### 📋 Top 10 Problem Areas (Sortable)")
+        
+        # LOCAL FILTER
+        table_col1, table_col2, _ = st.columns([1, 1, 2])
+        
+        with table_col1:
+            table_partner_options = ['All Partners'] + sorted(base_filtered_fulfillment['delivery_partner'].unique()) if 'delivery_partner' in base_filtered_fulfillment.columns else ['All Partners']
+            table_partner_filter = st.selectbox("Filter by Partner", table_partner_options, key="table_partner_filter")
+        
+        with table_col2:
+            table_reason_count = st.selectbox("Delay Reasons per Zone", [1, 2, 3], key="table_reason_count")
+        
+        # Apply local filter
+        table_where = {}
+        if table_partner_filter != 'All Partners' and 'delivery_partner' in base_fulfillment_cube.columns:
+            table_where['delivery_partner'] = table_partner_filter
+        
+        if 'delivery_zone' in base_fulfillment_cube.columns and 'breaches' in base_fulfillment_cube.columns:
+            zone_totals = window_aggregate(
+                'fulfillment_cube', 'delivery_zone', ['breaches', 'on_time', 'delay_days', 'deliveries'], table_where
+            ).set_index('delivery_zone')
+            dated_shipments = zone_totals['on_time'] + zone_totals['breaches']
+            if 'delay_reason' in base_fulfillment_cube.columns:
+                top_reasons = top_values_per_group(
+                    base_fulfillment_cube, 'delivery_zone', 'delay_reason', 'deliveries', table_reason_count, table_where
+                )
+                top_reason = top_reasons['delay_reason'].astype(str).groupby(
+                    top_reasons['delivery_zone'], observed=True, sort=False
+                ).agg(', '.join)
+                top_reason = top_reason.astype(object).reindex(zone_totals.index).fillna('N/A')
+            else:
+                top_reason = pd.Series('N/A', index=zone_totals.index)
+            
+            problem_zones = pd.DataFrame({
+                'Delivery Zone': zone_totals.index,
+                'SLA Breaches': zone_totals['breaches'].to_numpy(),
+                'Avg Delay Days': (zone_totals['delay_days'] / dated_shipments.where(dated_shipments > 0)).to_numpy(),
+                'Top Delay Reason': top_reason.to_numpy(),
+                'Total Orders': zone_totals['deliveries'].to_numpy(),
+            })
+            problem_zones = problem_zones.sort_values('SLA Breaches', ascending=False).head(10)
+            problem_zones['Avg Delay Days'] = problem_zones['Avg Delay Days'].round(1)
+            
+            st.dataframe(
+                problem_zones,
+                use_container_width=True,
+                column_config={
+                    "Delivery Zone": st.column_config.TextColumn("Delivery Zone"),
+                    "SLA Breaches": st.column_config.NumberColumn("SLA Breaches", format="%d"),
+                    "Avg Delay Days": st.column_config.NumberColumn("Avg Delay (Days)", format="%.1f"),
+                    "Top Delay Reason": st.column_config.TextColumn(
+                        "Primary Reason" if table_reason_count == 1 else f"Top {table_reason_count} Reasons"
+                    ),
+                    "Total Orders": st.column_config.NumberColumn("Total Orders", format="%d")
+                }
+            )
+        else:
+            st.info("Zone analysis data not available.")
+    
+    problem_areas_table()
     
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
     # ===== DRILL-DOWN =====
-    st.markdown("### 🔍 Zone Drill-Down Analysis")
-    
-    # LOCAL FILTER
-    if 'delivery_zone' in base_filtered_fulfillment.columns:
-        zone_list = base_filtered_fulfillment['delivery_zone'].dropna().unique().tolist()
+    @st.fragment
+    def zone_drilldown():
+        """Zone drill-down for the selected delivery zone"""
+        st.markdown("### 🔍 Zone Drill-Down Analysis")
         
-        if len(zone_list) > 0:
-            selected_zone = st.selectbox("Select a Delivery Zone", zone_list, key="drill_zone")
+        # LOCAL FILTER
+        if 'delivery_zone' in base_filtered_fulfillment.columns:
+            zone_list = sorted(base_filtered_fulfillment['delivery_zone'].dropna().unique())
             
-            if selected_zone:
-                zone_detail = base_filtered_fulfillment[base_filtered_fulfillment['delivery_zone'] == selected_zone]
-                zone_orders = base_filtered_orders[base_filtered_orders['order_id'].isin(zone_detail['order_id'])]
-                
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("Total Deliveries", f"{len(zone_detail):,}")
-                
-                with col2:
-                    if 'actual_delivery_date' in zone_detail.columns and 'promised_date' in zone_detail.columns:
-                        on_time_zone = len(zone_detail[zone_detail['actual_delivery_date'] <= zone_detail['promised_date']])
-                        on_time_pct = (on_time_zone / len(zone_detail) * 100) if len(zone_detail) > 0 else 0
-                    else:
-                        on_time_pct = 0
-                    st.metric("On-Time Rate", f"{on_time_pct:.1f}%")
-                
-                with col3:
-                    if 'order_status' in zone_orders.columns:
-                        zone_cancelled = len(zone_orders[zone_orders['order_status'] == 'Cancelled'])
-                        zone_cancel_rate = (zone_cancelled / len(zone_orders) * 100) if len(zone_orders) > 0 else 0
-                    else:
-                        zone_cancel_rate = 0
-                    st.metric("Cancellation Rate", f"{zone_cancel_rate:.1f}%")
+            if len(zone_list) > 0:
+                selected_zone = st.selectbox("Select a Delivery Zone", zone_list, key="drill_zone")
                 
-                with col4:
-                    if 'actual_delivery_date' in zone_detail.columns and 'promised_date' in zone_detail.columns:
-                        breach_zone = len(zone_detail[zone_detail['actual_delivery_date'] > zone_detail['promised_date']])
-                    else:
-                        breach_zone = 0
-                    st.metric("SLA Breaches", f"{breach_zone:,}")
-                
-                # Partner Performance Chart
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    if 'delay_reason' in zone_detail.columns:
-                        zone_delays = zone_detail[
-                            (zone_detail['delay_reason'].notna()) & 
-                            (zone_detail['delay_reason'] != 'No Delay')
-                        ]
-                        if len(zone_delays) > 0:
-                            delay_breakdown = zone_delays['delay_reason'].value_counts().reset_index()
-                            delay_breakdown.columns = ['Reason', 'Count']
+                if selected_zone:
+                    zone_where = {'delivery_zone': selected_zone}
+                    zone_measures = [col for col in ['deliveries', 'on_time', 'cancelled', 'breaches'] if col in base_fulfillment_cube.columns]
+                    zone_summary = totals(base_fulfillment_cube, zone_measures, zone_where)
+                    zone_deliveries = int(zone_summary['deliveries'])
+                    
+                    col1, col2, col3, col4 = st.columns(4)
+                    
+                    with col1:
+                        st.metric("Total Deliveries", f"{zone_deliveries:,}")
+                    
+                    with col2:
+                        if 'on_time' in zone_summary.index:
+                            on_time_zone = zone_summary['on_time']
+                            on_time_pct = (on_time_zone / zone_deliveries * 100) if zone_deliveries > 0 else 0
+                        else:
+                            on_time_pct = 0
+                        st.metric("On-Time Rate", f"{on_time_pct:.1f}%")
+                    
+                    with col3:
+                        if 'cancelled' in zone_summary.index:
+                            zone_cancelled = zone_summary['cancelled']
+                            zone_cancel_rate = (zone_cancelled / zone_deliveries * 100) if zone_deliveries > 0 else 0
+                        else:
+                            zone_cancel_rate = 0
+                        st.metric("Cancellation Rate", f"{zone_cancel_rate:.1f}%")
+                    
+                    with col4:
+                        if 'breaches' in zone_summary.index:
+                            breach_zone = int(zone_summary['breaches'])
+                        else:
+                            breach_zone = 0
+                        st.metric("SLA Breaches", f"{breach_zone:,}")
+                    
+                    # Partner Performance Chart
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        if 'delay_reason' in base_fulfillment_cube.columns:
+                            delay_breakdown = top_counts(base_fulfillment_cube, 'delay_reason', 'deliveries', zone_where)
+                            delay_breakdown = delay_breakdown.drop('No Delay', errors='ignore')
+                            if len(delay_breakdown) > 0:
+                                delay_breakdown = delay_breakdown.reset_index()
+                                delay_breakdown.columns = ['Reason', 'Count']
+                                
+                                fig = px.pie(delay_breakdown, values='Count', names='Reason',
+                                            color_discrete_sequence=CHART_COLORS, hole=0.4)
+                                fig.update_layout(
+                                    plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                    font_color='#e8e8e8',
+                                    title=dict(text='Delay Reasons', font=dict(color='#ffffff')),
+                                    margin=dict(l=0, r=0, t=40, b=0)
+                                )
+                                st.plotly_chart(fig, use_container_width=True)
+                            else:
+                                st.info("No delays in this zone.")
+                    
+                    with col2:
+                        if 'delivery_partner' in base_fulfillment_cube.columns:
+                            partner_perf = window_aggregate('fulfillment_cube', 'delivery_partner', zone_measures, zone_where)
+                            if 'breaches' not in partner_perf.columns:
+                                partner_perf['breaches'] = 0
                             
-                            fig = px.pie(delay_breakdown, values='Count', names='Reason',
-                                        color_discrete_sequence=CHART_COLORS, hole=0.4)
+                            partner_perf = partner_perf[['delivery_partner', 'deliveries', 'breaches']]
+                            partner_perf.columns = ['Partner', 'Deliveries', 'Breaches']
+                            partner_perf['On-Time Rate'] = ((partner_perf['Deliveries'] - partner_perf['Breaches']) / partner_perf['Deliveries'] * 100).round(1)
+                            partner_perf = partner_perf.sort_values('Deliveries', ascending=True)
+                            
+                            fig = px.bar(partner_perf, x='On-Time Rate', y='Partner', orientation='h',
+                                        color='On-Time Rate', color_continuous_scale=['#f87171', '#fb923c', '#4ade80'],
+                                        text='On-Time Rate')
+                            fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
                             fig.update_layout(
                                 plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-                                font_color='#e8e8e8',
-                                title=dict(text='Delay Reasons', font=dict(color='#ffffff')),
+                                font_color='#e8e8e8', showlegend=False, coloraxis_showscale=False,
+                                title=dict(text='Partner Performance', font=dict(color='#ffffff')),
+                                xaxis=dict(title='On-Time Rate (%)', range=[0, 110]),
+                                yaxis=dict(title=''),
                                 margin=dict(l=0, r=0, t=40, b=0)
                             )
                             st.plotly_chart(fig, use_container_width=True)
-                        else:
-                            st.info("No delays in this zone.")
-                
-                with col2:
-                    if 'delivery_partner' in zone_detail.columns:
-                        zone_detail_copy = zone_detail.copy()
-                        if 'actual_delivery_date' in zone_detail_copy.columns and 'promised_date' in zone_detail_copy.columns:
-                            zone_detail_copy['is_breach'] = zone_detail_copy['actual_delivery_date'] > zone_detail_copy['promised_date']
-                        else:
-                            zone_detail_copy['is_breach'] = False
-                        
-                        partner_perf = zone_detail_copy.groupby('delivery_partner').agg({
-                            'order_id': 'count'
-                        }).reset_index()
-                        partner_perf.columns = ['Partner', 'Deliveries']
-                        
-                        breach_by_partner = zone_detail_copy[zone_detail_copy['is_breach'] == True].groupby('delivery_partner').size().reset_index()
-                        breach_by_partner.columns = ['Partner', 'Breaches']
-                        
-                        partner_perf = partner_perf.merge(breach_by_partner, on='Partner', how='left')
-                        partner_perf['Breaches'] = partner_perf['Breaches'].fillna(0)
-                        partner_perf['On-Time Rate'] = ((partner_perf['Deliveries'] - partner_perf['Breaches']) / partner_perf['Deliveries'] * 100).round(1)
-                        partner_perf = partner_perf.sort_values('Deliveries', ascending=True)
-                        
-                        fig = px.bar(partner_perf, x='On-Time Rate', y='Partner', orientation='h',
-                                    color='On-Time Rate', color_continuous_scale=['#f87171', '#fb923c', '#4ade80'],
-                                    text='On-Time Rate')
-                        fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-                        fig.update_layout(
-                            plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-                            font_color='#e8e8e8', showlegend=False, coloraxis_showscale=False,
-                            title=dict(text='Partner Performance', font=dict(color='#ffffff')),
-                            xaxis=dict(title='On-Time Rate (%)', range=[0, 110]),
-                            yaxis=dict(title=''),
-                            margin=dict(l=0, r=0, t=40, b=0)
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+    
+    zone_drilldown()
     
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
@@ -1356,9 +3149,13 @@ else:
 # WHAT-IF ANALYSIS - SINGLE DRIVER MODEL
 # ================================================================================
 
-st.markdown("### 🔮 What-If Analysis: Single-Driver Model")
+# A hidden What-If section never asks the graph for its KPIs
+show_what_if = st.toggle("Show What-If Analysis", value=True, key="show_what_if")
 
-st.markdown("""
+if show_what_if:
+    st.markdown("### 🔮 What-If Analysis: Single-Driver Model")
+    
+    st.markdown("""
 <div class='insight-box'>
     <div class='insight-title'>📊 Model Explanation</div>
     <div class='insight-text'>
@@ -1368,497 +3165,530 @@ st.markdown("""
     </div>
 </div>
 """, unsafe_allow_html=True)
-
-st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-
-# ===== CURRENT STATE METRICS =====
-st.markdown("#### 📈 Current State Metrics")
-
-# Calculate current metrics from data
-current_otd = mgr_kpis['on_time_rate']
-current_cancel_rate = mgr_kpis['cancellation_rate']
-current_refunds = mgr_kpis['total_refunds']
-current_repeat_rate = exec_kpis['repeat_rate'] if 'repeat_rate' in exec_kpis else 25.0
-
-# Estimate current return rate
-total_orders = len(base_filtered_orders)
-total_returns = len(base_filtered_returns)
-current_return_rate = (total_returns / total_orders * 100) if total_orders > 0 else 5.0
-
-# Current NPS (estimated based on OTD - industry benchmark)
-current_nps = 30 + (current_otd - 70) * 1.0  # Base NPS of 30 at 70% OTD
-
-# Active customers
-active_customers = len(base_filtered_customers)
-
-# Average Order Value
-aov = mgr_kpis['avg_order_value'] if mgr_kpis['avg_order_value'] > 0 else 500
-
-# Display current state
-current_col1, current_col2, current_col3, current_col4, current_col5 = st.columns(5)
-
-with current_col1:
-    st.metric("Current OTD Rate", f"{current_otd:.1f}%")
-
-with current_col2:
-    st.metric("Cancellation Rate", f"{current_cancel_rate:.1f}%")
-
-with current_col3:
-    st.metric("Return Rate", f"{current_return_rate:.1f}%")
-
-with current_col4:
-    st.metric("Est. NPS Score", f"{current_nps:.0f}")
-
-with current_col5:
-    st.metric("Repeat Rate", f"{current_repeat_rate:.1f}%")
-
-st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-
-# ===== SINGLE DRIVER INPUT =====
-st.markdown("#### 🎯 Set Target On-Time Delivery Rate")
-
-col1, col2 = st.columns([2, 1])
-
-with col1:
-    target_otd = st.slider(
-        "Target On-Time Delivery Rate (%)",
-        min_value=max(70.0, current_otd),
-        max_value=99.0,
-        value=min(current_otd + 10, 99.0),
-        step=0.5,
-        format="%.1f%%",
-        help="Slide to set your target OTD rate. All other metrics will auto-calculate."
-    )
-
-with col2:
-    # Calculate improvement
-    delta_otd = target_otd - current_otd
-    
-    if delta_otd > 0:
-        st.markdown(f"""
-        <div class='whatif-box'>
-            <p style='color: #8facc4; font-size: 0.9rem;'>Improvement Required</p>
-            <p class='whatif-value'>+{delta_otd:.1f}%</p>
-            <p style='color: #6b8aae; font-size: 0.8rem;'>OTD improvement</p>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.info("Increase target OTD to see projections")
-
-st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-
-# ===== MATHEMATICAL MODEL COEFFICIENTS =====
-# These coefficients define the relationship between OTD and other metrics
-# Based on e-commerce industry research and benchmarks
-
-COEFFICIENTS = {
-    'cancel_reduction_per_otd': 0.04,      # 4% reduction in cancellation per 1% OTD improvement
-    'return_reduction_per_otd': 0.025,     # 2.5% reduction in returns per 1% OTD improvement
-    'nps_increase_per_otd': 1.5,           # 1.5 NPS points per 1% OTD improvement
-    'refund_reduction_per_otd': 0.05,      # 5% reduction in refunds per 1% OTD improvement
-    'repeat_increase_per_otd': 0.03,       # 3% increase in repeat rate per 1% OTD improvement
-    'investment_per_otd': 15000,           # AED 15,000 investment per 1% OTD improvement
-}
-
-# ===== CALCULATE PROJECTED METRICS =====
-if delta_otd > 0:
-    
-    # 1. New Cancellation Rate
-    cancel_multiplier = 1 - (COEFFICIENTS['cancel_reduction_per_otd'] * delta_otd)
-    new_cancel_rate = max(0, current_cancel_rate * cancel_multiplier)
-    cancel_reduction_pct = ((current_cancel_rate - new_cancel_rate) / current_cancel_rate * 100) if current_cancel_rate > 0 else 0
-    
-    # 2. New Return Rate
-    return_multiplier = 1 - (COEFFICIENTS['return_reduction_per_otd'] * delta_otd)
-    new_return_rate = max(0, current_return_rate * return_multiplier)
-    return_reduction_pct = ((current_return_rate - new_return_rate) / current_return_rate * 100) if current_return_rate > 0 else 0
     
-    # 3. New NPS Score
-    new_nps = min(100, current_nps + (COEFFICIENTS['nps_increase_per_otd'] * delta_otd))
-    nps_increase = new_nps - current_nps
-    
-    # 4. New Refunds
-    refund_multiplier = 1 - (COEFFICIENTS['refund_reduction_per_otd'] * delta_otd)
-    new_refunds = max(0, current_refunds * refund_multiplier)
-    refund_savings = current_refunds - new_refunds
+    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
     
-    # 5. New Repeat Rate
-    repeat_multiplier = 1 + (COEFFICIENTS['repeat_increase_per_otd'] * delta_otd)
-    new_repeat_rate = min(100, current_repeat_rate * repeat_multiplier)
-    repeat_increase_pct = new_repeat_rate - current_repeat_rate
+    # ===== CURRENT STATE METRICS =====
+    st.markdown("#### 📈 Current State Metrics")
     
-    # ===== FINANCIAL CALCULATIONS =====
+    # Calculate current metrics from data
+    exec_kpis = need('exec_kpis')
+    mgr_kpis = need('mgr_kpis')
+    current_otd = mgr_kpis['on_time_rate']
+    current_cancel_rate = mgr_kpis['cancellation_rate']
+    current_refunds = mgr_kpis['total_refunds']
+    current_repeat_rate = exec_kpis['repeat_rate'] if 'repeat_rate' in exec_kpis else 25.0
     
-    # Orders recovered from reduced cancellations
-    cancelled_orders = mgr_kpis['cancelled_orders']
-    orders_recovered = int(cancelled_orders * (cancel_reduction_pct / 100))
-    revenue_recovered = orders_recovered * aov
+    # Estimate current return rate
+    total_orders = len(base_filtered_facts)
+    total_returns = int(base_filtered_facts['return_count'].sum()) if 'return_count' in base_filtered_facts.columns else 0
+    current_return_rate = (total_returns / total_orders * 100) if total_orders > 0 else 5.0
     
-    # Additional revenue from increased repeat purchases
-    additional_repeat_orders = int(active_customers * (repeat_increase_pct / 100))
-    repeat_revenue = additional_repeat_orders * aov
+    # Current NPS (estimated based on OTD - industry benchmark)
+    current_nps = 30 + (current_otd - 70) * 1.0  # Base NPS of 30 at 70% OTD
     
-    # Total benefit
-    total_benefit = revenue_recovered + refund_savings + repeat_revenue
+    # Active customers
+    active_customers = window_customer_counts(base_filtered_facts, known_only=True)[0]
     
-    # Investment required
-    investment_cost = delta_otd * COEFFICIENTS['investment_per_otd']
+    # Average Order Value
+    aov = mgr_kpis['avg_order_value'] if mgr_kpis['avg_order_value'] > 0 else 500
     
-    # Net benefit and ROI
-    net_benefit = total_benefit - investment_cost
-    roi = ((total_benefit - investment_cost) / investment_cost * 100) if investment_cost > 0 else 0
+    # Display current state
+    current_col1, current_col2, current_col3, current_col4, current_col5 = st.columns(5)
     
-    # ===== DISPLAY PROJECTED METRICS =====
-    st.markdown("#### 📊 Projected Metrics (Auto-Calculated)")
+    with current_col1:
+        st.metric("Current OTD Rate", f"{current_otd:.1f}%")
     
-    # Create comparison cards
-    proj_col1, proj_col2, proj_col3, proj_col4, proj_col5 = st.columns(5)
+    with current_col2:
+        st.metric("Cancellation Rate", f"{current_cancel_rate:.1f}%")
     
-    with proj_col1:
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: #4ade80;'>
-            <div class='kpi-label'>Target OTD Rate</div>
-            <div class='kpi-value' style='color: #4ade80;'>{target_otd:.1f}%</div>
-            <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{delta_otd:.1f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
+    with current_col3:
+        st.metric("Return Rate", f"{current_return_rate:.1f}%")
     
-    with proj_col2:
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: #4ade80;'>
-            <div class='kpi-label'>New Cancel Rate</div>
-            <div class='kpi-value' style='color: #4ade80;'>{new_cancel_rate:.1f}%</div>
-            <div class='kpi-subtitle' style='color: #4ade80;'>↓ -{cancel_reduction_pct:.1f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
+    with current_col4:
+        st.metric("Est. NPS Score", f"{current_nps:.0f}")
     
-    with proj_col3:
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: #4ade80;'>
-            <div class='kpi-label'>New Return Rate</div>
-            <div class='kpi-value' style='color: #4ade80;'>{new_return_rate:.1f}%</div>
-            <div class='kpi-subtitle' style='color: #4ade80;'>↓ -{return_reduction_pct:.1f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with proj_col4:
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: #4ade80;'>
-            <div class='kpi-label'>New NPS Score</div>
-            <div class='kpi-value' style='color: #4ade80;'>{new_nps:.0f}</div>
-            <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{nps_increase:.1f}</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with proj_col5:
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: #4ade80;'>
-            <div class='kpi-label'>New Repeat Rate</div>
-            <div class='kpi-value' style='color: #4ade80;'>{new_repeat_rate:.1f}%</div>
-            <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{repeat_increase_pct:.1f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
+    with current_col5:
+        st.metric("Repeat Rate", f"{current_repeat_rate:.1f}%")
     
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== FINANCIAL IMPACT BREAKDOWN =====
-    st.markdown("#### 💰 Financial Impact Analysis")
-    
-    fin_col1, fin_col2 = st.columns(2)
-    
-    with fin_col1:
-        st.markdown("##### Revenue Gains")
-        
-        # Revenue breakdown table
-        revenue_data = {
-            'Source': [
-                'Recovered Orders (↓ Cancellations)',
-                'Repeat Purchases (↑ Retention)',
-                'Refund Savings (↓ Returns)'
-            ],
-            'Impact': [
-                f"{orders_recovered:,} orders",
-                f"{additional_repeat_orders:,} orders",
-                f"-{return_reduction_pct:.1f}% returns"
-            ],
-            'Value (AED)': [
-                f"{revenue_recovered:,.0f}",
-                f"{repeat_revenue:,.0f}",
-                f"{refund_savings:,.0f}"
-            ]
-        }
-        revenue_df = pd.DataFrame(revenue_data)
-        
-        st.dataframe(
-            revenue_df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Source": st.column_config.TextColumn("Revenue Source"),
-                "Impact": st.column_config.TextColumn("Impact"),
-                "Value (AED)": st.column_config.TextColumn("Value (AED)")
-            }
+
+# ===== SINGLE DRIVER INPUT =====
+@st.fragment
+def what_if_projection():
+    """Target OTD slider and everything projected from it"""
+    st.markdown("#### 🎯 Set Target On-Time Delivery Rate")
+
+    col1, col2 = st.columns([2, 1])
+
+    with col1:
+        target_otd = st.slider(
+            "Target On-Time Delivery Rate (%)",
+            min_value=max(70.0, current_otd),
+            max_value=99.0,
+            value=min(current_otd + 10, 99.0),
+            step=0.5,
+            format="%.1f%%",
+            help="Slide to set your target OTD rate. All other metrics will auto-calculate."
         )
+
+    with col2:
+        # Calculate improvement
+        delta_otd = target_otd - current_otd
+        
+        if delta_otd > 0:
+            st.markdown(f"""
+            <div class='whatif-box'>
+                <p style='color: #8facc4; font-size: 0.9rem;'>Improvement Required</p>
+                <p class='whatif-value'>+{delta_otd:.1f}%</p>
+                <p style='color: #6b8aae; font-size: 0.8rem;'>OTD improvement</p>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.info("Increase target OTD to see projections")
+
+    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+
+    # ===== CALCULATE PROJECTED METRICS =====
+    if delta_otd > 0:
         
-        st.markdown(f"""
-        <div class='whatif-box'>
-            <p style='color: #8facc4;'>Total Projected Benefit</p>
-            <p class='whatif-value'>{format_currency_short(total_benefit)}</p>
-            <p style='color: #6b8aae; font-size: 0.85rem;'>Full: {format_currency_full(total_benefit)}</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with fin_col2:
-        st.markdown("##### Investment & ROI")
+        # 1. New Cancellation Rate
+        cancel_multiplier = 1 - (COEFFICIENTS['cancel_reduction_per_otd'] * delta_otd)
+        new_cancel_rate = max(0, current_cancel_rate * cancel_multiplier)
+        cancel_reduction_pct = ((current_cancel_rate - new_cancel_rate) / current_cancel_rate * 100) if current_cancel_rate > 0 else 0
+        
+        # 2. New Return Rate
+        return_multiplier = 1 - (COEFFICIENTS['return_reduction_per_otd'] * delta_otd)
+        new_return_rate = max(0, current_return_rate * return_multiplier)
+        return_reduction_pct = ((current_return_rate - new_return_rate) / current_return_rate * 100) if current_return_rate > 0 else 0
+        
+        # 3. New NPS Score
+        new_nps = min(100, current_nps + (COEFFICIENTS['nps_increase_per_otd'] * delta_otd))
+        nps_increase = new_nps - current_nps
+        
+        # 4. New Refunds
+        refund_multiplier = 1 - (COEFFICIENTS['refund_reduction_per_otd'] * delta_otd)
+        new_refunds = max(0, current_refunds * refund_multiplier)
+        refund_savings = current_refunds - new_refunds
+        
+        # 5. New Repeat Rate
+        repeat_multiplier = 1 + (COEFFICIENTS['repeat_increase_per_otd'] * delta_otd)
+        new_repeat_rate = min(100, current_repeat_rate * repeat_multiplier)
+        repeat_increase_pct = new_repeat_rate - current_repeat_rate
+        
+        # ===== FINANCIAL CALCULATIONS =====
+        
+        # Orders recovered from reduced cancellations
+        cancelled_orders = mgr_kpis['cancelled_orders']
+        orders_recovered = int(cancelled_orders * (cancel_reduction_pct / 100))
+        revenue_recovered = orders_recovered * aov
+        
+        # Additional revenue from increased repeat purchases
+        additional_repeat_orders = int(active_customers * (repeat_increase_pct / 100))
+        repeat_revenue = additional_repeat_orders * aov
+        
+        # Total benefit
+        total_benefit = revenue_recovered + refund_savings + repeat_revenue
+        
+        # Investment required
+        investment_cost = delta_otd * COEFFICIENTS['investment_per_otd']
+        
+        # Net benefit and ROI
+        net_benefit = total_benefit - investment_cost
+        roi = ((total_benefit - investment_cost) / investment_cost * 100) if investment_cost > 0 else 0
+        
+        # ===== DISPLAY PROJECTED METRICS =====
+        st.markdown("#### 📊 Projected Metrics (Auto-Calculated)")
+        
+        # Create comparison cards
+        proj_col1, proj_col2, proj_col3, proj_col4, proj_col5 = st.columns(5)
+        
+        with proj_col1:
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: #4ade80;'>
+                <div class='kpi-label'>Target OTD Rate</div>
+                <div class='kpi-value' style='color: #4ade80;'>{target_otd:.1f}%</div>
+                <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{delta_otd:.1f}%</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with proj_col2:
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: #4ade80;'>
+                <div class='kpi-label'>New Cancel Rate</div>
+                <div class='kpi-value' style='color: #4ade80;'>{new_cancel_rate:.1f}%</div>
+                <div class='kpi-subtitle' style='color: #4ade80;'>↓ -{cancel_reduction_pct:.1f}%</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with proj_col3:
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: #4ade80;'>
+                <div class='kpi-label'>New Return Rate</div>
+                <div class='kpi-value' style='color: #4ade80;'>{new_return_rate:.1f}%</div>
+                <div class='kpi-subtitle' style='color: #4ade80;'>↓ -{return_reduction_pct:.1f}%</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with proj_col4:
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: #4ade80;'>
+                <div class='kpi-label'>New NPS Score</div>
+                <div class='kpi-value' style='color: #4ade80;'>{new_nps:.0f}</div>
+                <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{nps_increase:.1f}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with proj_col5:
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: #4ade80;'>
+                <div class='kpi-label'>New Repeat Rate</div>
+                <div class='kpi-value' style='color: #4ade80;'>{new_repeat_rate:.1f}%</div>
+                <div class='kpi-subtitle' style='color: #4ade80;'>↑ +{repeat_increase_pct:.1f}%</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+        
+        # ===== FINANCIAL IMPACT BREAKDOWN =====
+        st.markdown("#### 💰 Financial Impact Analysis")
+        
+        fin_col1, fin_col2 = st.columns(2)
+        
+        with fin_col1:
+            st.markdown("##### Revenue Gains")
+            
+            # Revenue breakdown table
+            revenue_data = {
+                'Source': [
+                    'Recovered Orders (↓ Cancellations)',
+                    'Repeat Purchases (↑ Retention)',
+                    'Refund Savings (↓ Returns)'
+                ],
+                'Impact': [
+                    f"{orders_recovered:,} orders",
+                    f"{additional_repeat_orders:,} orders",
+                    f"-{return_reduction_pct:.1f}% returns"
+                ],
+                'Value (AED)': [
+                    f"{revenue_recovered:,.0f}",
+                    f"{repeat_revenue:,.0f}",
+                    f"{refund_savings:,.0f}"
+                ]
+            }
+            revenue_df = pd.DataFrame(revenue_data)
+            
+            st.dataframe(
+                revenue_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Source": st.column_config.TextColumn("Revenue Source"),
+                    "Impact": st.column_config.TextColumn("Impact"),
+                    "Value (AED)": st.column_config.TextColumn("Value (AED)")
+                }
+            )
+            
+            st.markdown(f"""
+            <div class='whatif-box'>
+                <p style='color: #8facc4;'>Total Projected Benefit</p>
+                <p class='whatif-value'>{format_currency_short(total_benefit)}</p>
+                <p style='color: #6b8aae; font-size: 0.85rem;'>Full: {format_currency_full(total_benefit)}</p>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with fin_col2:
+            st.markdown("##### Investment & ROI")
+            
+            # Investment breakdown
+            st.markdown(f"""
+            <div class='insight-box'>
+                <p style='color: #e8e8e8;'><strong>Investment Required:</strong></p>
+                <p style='color: #fb923c; font-size: 1.5rem; font-weight: bold;'>{format_currency_short(investment_cost)}</p>
+                <p style='color: #8facc4; font-size: 0.85rem;'>
+                    Based on AED {COEFFICIENTS['investment_per_otd']:,} per 1% OTD improvement<br>
+                    (Covers: logistics optimization, staffing, technology upgrades)
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # ROI Box
+            roi_color = '#4ade80' if roi > 0 else '#f87171'
+            net_color = '#4ade80' if net_benefit > 0 else '#f87171'
+            
+            st.markdown(f"""
+            <div class='kpi-card' style='border-color: {roi_color};'>
+                <div class='kpi-label'>Return on Investment</div>
+                <div class='kpi-value' style='color: {roi_color};'>{roi:.0f}%</div>
+                <div class='kpi-subtitle'>Net Benefit: <span style='color: {net_color};'>{format_currency_short(net_benefit)}</span></div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+        
+        # ===== VISUALIZATION: BEFORE VS AFTER =====
+        st.markdown("#### 📊 Before vs After Comparison")
+        
+        viz_col1, viz_col2 = st.columns(2)
+        
+        with viz_col1:
+            # Metrics comparison bar chart
+            comparison_data = pd.DataFrame({
+                'Metric': ['OTD Rate', 'Cancel Rate', 'Return Rate', 'Repeat Rate'],
+                'Current': [current_otd, current_cancel_rate, current_return_rate, current_repeat_rate],
+                'Projected': [target_otd, new_cancel_rate, new_return_rate, new_repeat_rate]
+            })
+            
+            fig = go.Figure()
+            
+            fig.add_trace(go.Bar(
+                name='Current',
+                x=comparison_data['Metric'],
+                y=comparison_data['Current'],
+                marker_color='#3a86ff',
+                text=[f"{v:.1f}%" for v in comparison_data['Current']],
+                textposition='outside'
+            ))
+            
+            fig.add_trace(go.Bar(
+                name='Projected',
+                x=comparison_data['Metric'],
+                y=comparison_data['Projected'],
+                marker_color='#4ade80',
+                text=[f"{v:.1f}%" for v in comparison_data['Projected']],
+                textposition='outside'
+            ))
+            
+            fig.update_layout(
+                title='Operational Metrics: Current vs Projected',
+                barmode='group',
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font_color='#e8e8e8',
+                legend=dict(orientation='h', yanchor='bottom', y=1.02, bgcolor='rgba(0,0,0,0)'),
+                xaxis=dict(gridcolor='rgba(58,134,255,0.1)'),
+                yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Percentage (%)'),
+                margin=dict(l=0, r=0, t=60, b=0)
+            )
+            
+            st.plotly_chart(fig, use_container_width=True)
         
-        # Investment breakdown
-        st.markdown(f"""
-        <div class='insight-box'>
-            <p style='color: #e8e8e8;'><strong>Investment Required:</strong></p>
-            <p style='color: #fb923c; font-size: 1.5rem; font-weight: bold;'>{format_currency_short(investment_cost)}</p>
-            <p style='color: #8facc4; font-size: 0.85rem;'>
-                Based on AED {COEFFICIENTS['investment_per_otd']:,} per 1% OTD improvement<br>
-                (Covers: logistics optimization, staffing, technology upgrades)
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
+        with viz_col2:
+            # Financial impact waterfall
+            waterfall_data = {
+                'Category': ['Revenue<br>Recovered', 'Repeat<br>Revenue', 'Refund<br>Savings', 
+                            'Investment', 'Net<br>Benefit'],
+                'Amount': [revenue_recovered, repeat_revenue, refund_savings, 
+                          -investment_cost, net_benefit],
+                'Type': ['gain', 'gain', 'gain', 'cost', 'total']
+            }
+            
+            colors = []
+            for t in waterfall_data['Type']:
+                if t == 'gain':
+                    colors.append('#4ade80')
+                elif t == 'cost':
+                    colors.append('#f87171')
+                else:
+                    colors.append('#3a86ff')
+            
+            fig = go.Figure(go.Waterfall(
+                name="Financial Impact",
+                orientation="v",
+                x=waterfall_data['Category'],
+                y=waterfall_data['Amount'],
+                connector={"line": {"color": "#8facc4"}},
+                decreasing={"marker": {"color": "#f87171"}},
+                increasing={"marker": {"color": "#4ade80"}},
+                totals={"marker": {"color": "#3a86ff"}},
+                text=[f"AED {abs(v):,.0f}" for v in waterfall_data['Amount']],
+                textposition="outside"
+            ))
+            
+            fig.update_layout(
+                title='Financial Impact Waterfall',
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font_color='#e8e8e8',
+                xaxis=dict(gridcolor='rgba(58,134,255,0.1)'),
+                yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Amount (AED)'),
+                margin=dict(l=0, r=0, t=60, b=0),
+                showlegend=False
+            )
+            
+            st.plotly_chart(fig, use_container_width=True)
         
-        # ROI Box
-        roi_color = '#4ade80' if roi > 0 else '#f87171'
-        net_color = '#4ade80' if net_benefit > 0 else '#f87171'
+        st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
         
-        st.markdown(f"""
-        <div class='kpi-card' style='border-color: {roi_color};'>
-            <div class='kpi-label'>Return on Investment</div>
-            <div class='kpi-value' style='color: {roi_color};'>{roi:.0f}%</div>
-            <div class='kpi-subtitle'>Net Benefit: <span style='color: {net_color};'>{format_currency_short(net_benefit)}</span></div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== VISUALIZATION: BEFORE VS AFTER =====
-    st.markdown("#### 📊 Before vs After Comparison")
-    
-    viz_col1, viz_col2 = st.columns(2)
-    
-    with viz_col1:
-        # Metrics comparison bar chart
-        comparison_data = pd.DataFrame({
-            'Metric': ['OTD Rate', 'Cancel Rate', 'Return Rate', 'Repeat Rate'],
-            'Current': [current_otd, current_cancel_rate, current_return_rate, current_repeat_rate],
-            'Projected': [target_otd, new_cancel_rate, new_return_rate, new_repeat_rate]
+        # ===== SENSITIVITY ANALYSIS =====
+        st.markdown("#### 📈 Sensitivity Analysis")
+        st.caption("How does the ROI change at different OTD improvement levels?")
+        
+        sensitivity_step = st.select_slider(
+            "Grid resolution (OTD points)", SENSITIVITY_STEPS, value=0.1, key="sensitivity_step"
+        )
+        
+        # Evaluate ROI over every OTD improvement from the current rate up to 99% in one pass
+        sensitivity_baseline = {
+            'cancelled_orders': cancelled_orders, 'cancel_rate': current_cancel_rate,
+            'repeat_rate': current_repeat_rate, 'refunds': current_refunds,
+            'active_customers': active_customers, 'aov': aov,
+        }
+        otd_deltas = otd_delta_grid(current_otd, sensitivity_step)
+        sensitivity = evaluate_what_if(otd_deltas, sensitivity_baseline, COEFFICIENTS)
+        sensitivity_df = pd.DataFrame({
+            'OTD Improvement': otd_deltas,
+            'Target OTD': current_otd + otd_deltas,
+            'Investment': sensitivity['investment'],
+            'Total Benefit': sensitivity['total_benefit'],
+            'Net Benefit': sensitivity['net_benefit'],
+            'ROI': sensitivity['roi']
         })
         
+        # ROI curve chart
         fig = go.Figure()
         
-        fig.add_trace(go.Bar(
-            name='Current',
-            x=comparison_data['Metric'],
-            y=comparison_data['Current'],
-            marker_color='#3a86ff',
-            text=[f"{v:.1f}%" for v in comparison_data['Current']],
-            textposition='outside'
+        fig.add_trace(go.Scatter(
+            x=sensitivity_df['OTD Improvement'],
+            y=sensitivity_df['ROI'],
+            mode='lines+markers' if len(sensitivity_df) <= 50 else 'lines',
+            name='ROI %',
+            line=dict(color='#3a86ff', width=3),
+            marker=dict(size=8)
         ))
         
-        fig.add_trace(go.Bar(
-            name='Projected',
-            x=comparison_data['Metric'],
-            y=comparison_data['Projected'],
-            marker_color='#4ade80',
-            text=[f"{v:.1f}%" for v in comparison_data['Projected']],
-            textposition='outside'
+        # Add break-even line
+        fig.add_hline(y=0, line_dash="dash", line_color="#fb923c", 
+                      annotation_text="Break-Even", annotation_position="right")
+        
+        # Highlight current selection
+        fig.add_trace(go.Scatter(
+            x=[delta_otd],
+            y=[float(evaluate_what_if(delta_otd, sensitivity_baseline, COEFFICIENTS)['roi'])],
+            mode='markers',
+            name='Your Target',
+            marker=dict(size=15, color='#4ade80', symbol='star')
         ))
         
         fig.update_layout(
-            title='Operational Metrics: Current vs Projected',
-            barmode='group',
+            title='ROI Sensitivity to OTD Improvement',
             plot_bgcolor='rgba(0,0,0,0)',
             paper_bgcolor='rgba(0,0,0,0)',
             font_color='#e8e8e8',
             legend=dict(orientation='h', yanchor='bottom', y=1.02, bgcolor='rgba(0,0,0,0)'),
-            xaxis=dict(gridcolor='rgba(58,134,255,0.1)'),
-            yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Percentage (%)'),
+            xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='OTD Improvement', ticksuffix='%', tickprefix='+'),
+            yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='ROI (%)'),
             margin=dict(l=0, r=0, t=60, b=0)
         )
         
         st.plotly_chart(fig, use_container_width=True)
-    
-    with viz_col2:
-        # Financial impact waterfall
-        waterfall_data = {
-            'Category': ['Revenue<br>Recovered', 'Repeat<br>Revenue', 'Refund<br>Savings', 
-                        'Investment', 'Net<br>Benefit'],
-            'Amount': [revenue_recovered, repeat_revenue, refund_savings, 
-                      -investment_cost, net_benefit],
-            'Type': ['gain', 'gain', 'gain', 'cost', 'total']
-        }
         
-        colors = []
-        for t in waterfall_data['Type']:
-            if t == 'gain':
-                colors.append('#4ade80')
-            elif t == 'cost':
-                colors.append('#f87171')
+        # ===== 2-D SENSITIVITY HEATMAP =====
+        if st.toggle("2-D sensitivity heatmap", key="sensitivity_heatmap",
+                     help="ROI across a grid of two model coefficients, or one coefficient × target OTD"):
+            heatmap_axes = [HEATMAP_TARGET_OTD] + HEATMAP_COEFFICIENTS
+            
+            heat_col1, heat_col2, _ = st.columns([1, 1, 2])
+            with heat_col1:
+                heat_x = st.selectbox("X Axis", heatmap_axes, index=heatmap_axes.index('investment_per_otd'),
+                                      format_func=heatmap_axis_label, key="heatmap_x_axis")
+            with heat_col2:
+                heat_y = st.selectbox("Y Axis", heatmap_axes, index=0, format_func=heatmap_axis_label, key="heatmap_y_axis")
+            
+            if heat_x == heat_y:
+                st.info("Pick two different axes.")
             else:
-                colors.append('#3a86ff')
-        
-        fig = go.Figure(go.Waterfall(
-            name="Financial Impact",
-            orientation="v",
-            x=waterfall_data['Category'],
-            y=waterfall_data['Amount'],
-            connector={"line": {"color": "#8facc4"}},
-            decreasing={"marker": {"color": "#f87171"}},
-            increasing={"marker": {"color": "#4ade80"}},
-            totals={"marker": {"color": "#3a86ff"}},
-            text=[f"AED {abs(v):,.0f}" for v in waterfall_data['Amount']],
-            textposition="outside"
-        ))
+                # Served from the result cache when the axes and model inputs are unchanged
+                heat_x_values, heat_y_values, heat_roi = need(
+                    'roi_heatmap', x_axis=heat_x, y_axis=heat_y, otd_delta=delta_otd,
+                    otd_step=sensitivity_step, current_otd=current_otd,
+                    baseline=tuple(sorted(sensitivity_baseline.items())),
+                    coefficients=tuple(sorted(COEFFICIENTS.items()))
+                )
+                
+                fig = go.Figure(go.Heatmap(
+                    x=heat_x_values, y=heat_y_values, z=heat_roi,
+                    colorscale=[[0, '#f87171'], [0.5, '#1a2d47'], [1, '#4ade80']], zmid=0,
+                    colorbar=dict(title='ROI (%)'),
+                    hovertemplate='X: %{x:,.4g}<br>Y: %{y:,.4g}<br>ROI: %{z:.1f}%<extra></extra>'
+                ))
+                
+                # Current model point
+                model_point = lambda axis: target_otd if axis == HEATMAP_TARGET_OTD else COEFFICIENTS[axis]
+                fig.add_trace(go.Scatter(
+                    x=[model_point(heat_x)], y=[model_point(heat_y)],
+                    mode='markers', name='Current Model',
+                    marker=dict(size=15, color='#ffffff', symbol='star')
+                ))
+                
+                fig.update_layout(
+                    title=f'ROI: {heatmap_axis_label(heat_x)} × {heatmap_axis_label(heat_y)}',
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    font_color='#e8e8e8', showlegend=False,
+                    xaxis=dict(title=heatmap_axis_label(heat_x)),
+                    yaxis=dict(title=heatmap_axis_label(heat_y)),
+                    margin=dict(l=0, r=0, t=60, b=0)
+                )
+                
+                st.plotly_chart(fig, use_container_width=True)
         
-        fig.update_layout(
-            title='Financial Impact Waterfall',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color='#e8e8e8',
-            xaxis=dict(gridcolor='rgba(58,134,255,0.1)'),
-            yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='Amount (AED)'),
-            margin=dict(l=0, r=0, t=60, b=0),
-            showlegend=False
-        )
+        # Sensitivity table
+        with st.expander("📋 View Detailed Sensitivity Table"):
+            display_df = sensitivity_df.copy()
+            decimals = 1 if sensitivity_step >= 0.1 else 2
+            display_df['OTD Improvement'] = display_df['OTD Improvement'].apply(lambda x: f"+{x:.{decimals}f}%")
+            display_df['Target OTD'] = display_df['Target OTD'].apply(lambda x: f"{x:.{decimals}f}%")
+            display_df['Investment'] = display_df['Investment'].apply(lambda x: f"AED {x:,.0f}")
+            display_df['Total Benefit'] = display_df['Total Benefit'].apply(lambda x: f"AED {x:,.0f}")
+            display_df['Net Benefit'] = display_df['Net Benefit'].apply(lambda x: f"AED {x:,.0f}")
+            display_df['ROI'] = display_df['ROI'].apply(lambda x: f"{x:.1f}%")
+            
+            st.dataframe(display_df, use_container_width=True, hide_index=True)
         
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== SENSITIVITY ANALYSIS =====
-    st.markdown("#### 📈 Sensitivity Analysis")
-    st.caption("How does the ROI change at different OTD improvement levels?")
-    
-    # Calculate ROI at different improvement levels
-    sensitivity_data = []
-    for otd_improvement in range(1, 21):
-        test_otd = current_otd + otd_improvement
-        if test_otd > 99:
-            break
-        
-        # Calculate metrics at this level
-        test_cancel_reduction = current_cancel_rate * COEFFICIENTS['cancel_reduction_per_otd'] * otd_improvement
-        test_orders_recovered = int(cancelled_orders * (test_cancel_reduction / current_cancel_rate)) if current_cancel_rate > 0 else 0
-        test_revenue = test_orders_recovered * aov
-        
-        test_repeat_increase = current_repeat_rate * COEFFICIENTS['repeat_increase_per_otd'] * otd_improvement
-        test_repeat_orders = int(active_customers * (test_repeat_increase / 100))
-        test_repeat_revenue = test_repeat_orders * aov
-        
-        test_refund_savings = current_refunds * COEFFICIENTS['refund_reduction_per_otd'] * otd_improvement
-        
-        test_total_benefit = test_revenue + test_repeat_revenue + test_refund_savings
-        test_investment = otd_improvement * COEFFICIENTS['investment_per_otd']
-        test_roi = ((test_total_benefit - test_investment) / test_investment * 100) if test_investment > 0 else 0
-        test_net = test_total_benefit - test_investment
-        
-        sensitivity_data.append({
-            'OTD Improvement': f"+{otd_improvement}%",
-            'Target OTD': f"{test_otd:.1f}%",
-            'Investment': test_investment,
-            'Total Benefit': test_total_benefit,
-            'Net Benefit': test_net,
-            'ROI': test_roi
-        })
-    
-    sensitivity_df = pd.DataFrame(sensitivity_data)
-    
-    # ROI curve chart
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(
-        x=[d['OTD Improvement'] for d in sensitivity_data],
-        y=[d['ROI'] for d in sensitivity_data],
-        mode='lines+markers',
-        name='ROI %',
-        line=dict(color='#3a86ff', width=3),
-        marker=dict(size=8)
-    ))
-    
-    # Add break-even line
-    fig.add_hline(y=0, line_dash="dash", line_color="#fb923c", 
-                  annotation_text="Break-Even", annotation_position="right")
-    
-    # Highlight current selection
-    current_idx = int(delta_otd) - 1 if delta_otd >= 1 else 0
-    if current_idx < len(sensitivity_data):
-        fig.add_trace(go.Scatter(
-            x=[sensitivity_data[current_idx]['OTD Improvement']],
-            y=[sensitivity_data[current_idx]['ROI']],
-            mode='markers',
-            name='Your Target',
-            marker=dict(size=15, color='#4ade80', symbol='star')
-        ))
-    
-    fig.update_layout(
-        title='ROI Sensitivity to OTD Improvement',
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font_color='#e8e8e8',
-        legend=dict(orientation='h', yanchor='bottom', y=1.02, bgcolor='rgba(0,0,0,0)'),
-        xaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='OTD Improvement'),
-        yaxis=dict(gridcolor='rgba(58,134,255,0.1)', title='ROI (%)'),
-        margin=dict(l=0, r=0, t=60, b=0)
-    )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Sensitivity table
-    with st.expander("📋 View Detailed Sensitivity Table"):
-        display_df = sensitivity_df.copy()
-        display_df['Investment'] = display_df['Investment'].apply(lambda x: f"AED {x:,.0f}")
-        display_df['Total Benefit'] = display_df['Total Benefit'].apply(lambda x: f"AED {x:,.0f}")
-        display_df['Net Benefit'] = display_df['Net Benefit'].apply(lambda x: f"AED {x:,.0f}")
-        display_df['ROI'] = display_df['ROI'].apply(lambda x: f"{x:.1f}%")
+        st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
         
-        st.dataframe(display_df, use_container_width=True, hide_index=True)
-    
-    st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    
-    # ===== MODEL ASSUMPTIONS =====
-    with st.expander("📐 View Model Equations & Assumptions"):
-        st.markdown("""
-        ### Mathematical Relationships
-        
-        **Single Driver:** On-Time Delivery Rate (OTD)
-        
-        **Derived Equations:**
-        
-        | Metric | Formula | Coefficient |
-        |--------|---------|-------------|
-        | Cancellation Rate | `New = Current × (1 - 0.04 × ΔOTD)` | -4% per 1% OTD |
-        | Return Rate | `New = Current × (1 - 0.025 × ΔOTD)` | -2.5% per 1% OTD |
-        | NPS Score | `New = Current + (1.5 × ΔOTD)` | +1.5 per 1% OTD |
-        | Refunds | `New = Current × (1 - 0.05 × ΔOTD)` | -5% per 1% OTD |
-        | Repeat Rate | `New = Current × (1 + 0.03 × ΔOTD)` | +3% per 1% OTD |
-        
-        **Financial Impact:**
-        
-        ```
-        Revenue Recovered = Orders Saved × Average Order Value
-        Repeat Revenue = Additional Repeat Orders × Average Order Value
-        Total Benefit = Revenue Recovered + Repeat Revenue + Refund Savings
-        Investment = ΔOTD × AED 15,000
-        Net Benefit = Total Benefit - Investment
-        ROI = (Total Benefit - Investment) / Investment × 100%
-        ```
-        
-        **Assumptions:**
-        1. Linear relationships within the modeled range
-        2. Investment cost of AED 15,000 per 1% OTD improvement
-        3. Coefficients based on e-commerce industry benchmarks
-        4. No external market factors considered
-        5. Customer behavior responds predictably to service improvements
-        """)
+        # ===== MODEL ASSUMPTIONS =====
+        with st.expander("📐 View Model Equations & Assumptions"):
+            st.markdown("""
+            ### Mathematical Relationships
+            
+            **Single Driver:** On-Time Delivery Rate (OTD)
+            
+            **Derived Equations:**
+            
+            | Metric | Formula | Coefficient |
+            |--------|---------|-------------|
+            | Cancellation Rate | `New = Current × (1 - 0.04 × ΔOTD)` | -4% per 1% OTD |
+            | Return Rate | `New = Current × (1 - 0.025 × ΔOTD)` | -2.5% per 1% OTD |
+            | NPS Score | `New = Current + (1.5 × ΔOTD)` | +1.5 per 1% OTD |
+            | Refunds | `New = Current × (1 - 0.05 × ΔOTD)` | -5% per 1% OTD |
+            | Repeat Rate | `New = Current × (1 + 0.03 × ΔOTD)` | +3% per 1% OTD |
+            
+            **Financial Impact:**
+            
+            ```
+            Revenue Recovered = Orders Saved × Average Order Value
+            Repeat Revenue = Additional Repeat Orders × Average Order Value
+            Total Benefit = Revenue Recovered + Repeat Revenue + Refund Savings
+            Investment = ΔOTD × AED 15,000
+            Net Benefit = Total Benefit - Investment
+            ROI = (Total Benefit - Investment) / Investment × 100%
+            ```
+            
+            **Assumptions:**
+            1. Linear relationships within the modeled range
+            2. Investment cost of AED 15,000 per 1% OTD improvement
+            3. Coefficients based on e-commerce industry benchmarks
+            4. No external market factors considered
+            5. Customer behavior responds predictably to service improvements
+            """)
 
-else:
-    st.info("👆 Increase the target OTD rate above the current rate to see projections.")
+    else:
+        st.info("👆 Increase the target OTD rate above the current rate to see projections.")
+
+if show_what_if:
+    what_if_projection()
 
 # ================================================================================
 # FOOTER